@@ -0,0 +1,140 @@
+# answer_store.py
+from models import StudentAnswers
+from grading import score_answer
+
+# 每条 INSERT 语句最多写入的答案行数
+UPSERT_CHUNK_SIZE = 500
+
+# 可选写入的列：reserved1 为即时批改得分，reserved2 为小程序增量同步的序号或整卷提交标记
+OPTIONAL_FIELDS = ('reserved1', 'reserved2')
+
+# 整卷提交时写入 reserved2 的标记前缀，之后到达的增量同步一律丢弃，不会覆盖最终提交的答案
+SUBMITTED_SEQ = 'submitted'
+
+
+def submitted_marker(submitted_at):
+    """
+    整卷提交写入 reserved2 的标记，带提交时间（定宽的 Unix 时间戳），同一题的两个标记可直接按字符串比较先后。
+    没有提交时间（旧版本写缓冲日志中的提交）时只写 SUBMITTED_SEQ，早于任何带时间的标记。
+    """
+    if submitted_at is None:
+        return SUBMITTED_SEQ
+    return f'{SUBMITTED_SEQ}:{submitted_at:017.6f}'
+
+
+def build_answer_rows(student_id, exam_id, answers, answer_key=None):
+    """
+    把提交的答案字典转换为待写入的行，值为 None（取消作答）的题目不生成行，由 cleared_questions 取出后删除。
+    :param answers: {question_id: {"selected_option_id": ..., "answer_text": ...} 或 None}
+    :param answer_key: 可选，传入时为客观题计算得分写入 reserved1
+    """
+    rows = []
+    for question_id, answer_data in answers.items():
+        if answer_data is None:
+            continue
+        question_id = int(question_id)
+        row = {
+            "student": student_id,
+            "exam": exam_id,
+            "question": question_id,
+            "selected_option": answer_data.get('selected_option_id'),
+            "answer_text": answer_data.get('answer_text'),
+        }
+        if answer_key is not None:
+            key = answer_key.get(question_id)
+            row["reserved1"] = score_answer(key, row["selected_option"], row["answer_text"]) if key else None
+        rows.append(row)
+    return rows
+
+
+def cleared_questions(answers):
+    """
+    :return: 提交中明确取消作答（值为 None）的题目ID列表
+    """
+    return [int(question_id) for question_id, answer_data in answers.items() if answer_data is None]
+
+
+def load_existing_answers(student_id, exam_id, question_ids):
+    """
+    一次查询取出学生已保存答案的得分和同步序号，用于丢弃过期的增量提交。
+    :return: {question_id: (reserved1 得分, reserved2 同步序号)}
+    """
+    if not question_ids:
+        return {}
+    query = (StudentAnswers
+             .select(StudentAnswers.question, StudentAnswers.reserved1, StudentAnswers.reserved2)
+             .where(StudentAnswers.student == student_id,
+                    StudentAnswers.exam == exam_id,
+                    StudentAnswers.question.in_(list(question_ids))))
+    return {question_id: (score, seq) for question_id, score, seq in query.tuples()}
+
+
+def is_submitted(student_id, exam_id):
+    """
+    学生是否已整卷提交过该考试的答案。
+    """
+    return (StudentAnswers
+            .select(StudentAnswers.id)
+            .where(StudentAnswers.student == student_id,
+                   StudentAnswers.exam == exam_id,
+                   StudentAnswers.reserved2.startswith(SUBMITTED_SEQ))
+            .exists())
+
+
+def load_submitted_markers(student_ids, exam_ids):
+    """
+    取出这些学生在这些考试中整卷提交过的答案的提交标记，用于跳过已被更晚的整卷提交覆盖的答案。
+    :return: {(student_id, exam_id, question_id): 提交标记}
+    """
+    if not student_ids or not exam_ids:
+        return {}
+    query = (StudentAnswers
+             .select(StudentAnswers.student, StudentAnswers.exam, StudentAnswers.question, StudentAnswers.reserved2)
+             .where(StudentAnswers.student.in_(list(student_ids)),
+                    StudentAnswers.exam.in_(list(exam_ids)),
+                    StudentAnswers.reserved2.startswith(SUBMITTED_SEQ)))
+    return {(student_id, exam_id, question_id): marker for student_id, exam_id, question_id, marker in query.tuples()}
+
+
+def delete_answers(student_id, exam_id, question_ids):
+    """
+    删除学生已保存的这些题目的答案，返回删除的行数。调用方负责开启事务。
+    """
+    if not question_ids:
+        return 0
+    return (StudentAnswers
+            .delete()
+            .where(StudentAnswers.student == student_id,
+                   StudentAnswers.exam == exam_id,
+                   StudentAnswers.question.in_(list(question_ids)))
+            .execute())
+
+
+def upsert_answers(rows):
+    """
+    用多行 INSERT ... ON DUPLICATE KEY UPDATE 写入答案，依赖 (student_id, exam_id, question_id) 唯一键。
+    行中带有得分（reserved1）或同步序号（reserved2）时一并覆盖，否则保留已有值。调用方负责开启事务。
+    """
+    groups = {}
+    for row in rows:
+        optional = tuple(name for name in OPTIONAL_FIELDS if row.get(name) is not None)
+        groups.setdefault(optional, []).append(row)
+    for optional, group in groups.items():
+        _insert_rows(group, optional)
+    return len(rows)
+
+
+def _insert_rows(rows, optional):
+    fields = [StudentAnswers.student, StudentAnswers.exam, StudentAnswers.question,
+              StudentAnswers.selected_option, StudentAnswers.answer_text]
+    preserve = [StudentAnswers.selected_option, StudentAnswers.answer_text]
+    for name in optional:
+        fields.append(getattr(StudentAnswers, name))
+        preserve.append(getattr(StudentAnswers, name))
+
+    for start in range(0, len(rows), UPSERT_CHUNK_SIZE):
+        chunk = rows[start:start + UPSERT_CHUNK_SIZE]
+        (StudentAnswers
+         .insert_many([tuple(row[field.name] for field in fields) for row in chunk], fields=fields)
+         .on_conflict(preserve=preserve)
+         .execute())
@@ -1,16 +1,91 @@
 #api.py
+import atexit
 from datetime import datetime
+import hashlib
+import hmac
+import json
+import logging
 import os
 import tempfile
 from flask import Flask, redirect, request, jsonify, render_template, session, url_for
 from methods import StudentModule, TeacherModule, AdminModule
-from models import ExamQuestions, Exams, QuestionBanks, QuestionOptions, Questions, StudentAnswers, StudentGrades, Students
+from exam_cache import invalidate_exam_caches, paper_cache
+from import_jobs import ImportJobRunner
+from log_index import SEARCH_FIELDS, LogIndex
+from log_reader import LOG_LEVELS, LogReader
+from query_detector import NPlusOneDetector
+from request_metrics import PROMETHEUS_CONTENT_TYPE, RequestMetrics
+from submission_buffer import SubmissionBuffer
+from models import db, ExamQuestions, Exams, QuestionBanks, QuestionOptions, Questions, StudentAnswers, StudentGrades, Students
 app = Flask(__name__)
+logger = logging.getLogger(__name__)
+
+# 以 python api.py 运行时 app.run(debug=True) 会启动重载器：父进程只监视文件变化并重启子进程，不处理请求，
+# 子进程带有环境变量 WERKZEUG_RUN_MAIN=true。后台线程和本地日志只在处理请求的进程中启动
+SERVING_PROCESS = __name__ != '__main__' or os.environ.get('WERKZEUG_RUN_MAIN') == 'true'
+
+# 各路由的请求耗时和SQL统计，需在其他请求钩子之前注册
+request_metrics = RequestMetrics(app, db)
+
+# 开发和测试时检测 N+1 查询：设置环境变量 N_PLUS_ONE=warn 记录警告，N_PLUS_ONE=raise 直接抛出异常，
+# 同一形状的SQL在一次请求中的允许次数由 N_PLUS_ONE_THRESHOLD 配置（默认 5）
+if os.environ.get('N_PLUS_ONE', 'off') in ('warn', 'raise'):
+    n_plus_one_detector = NPlusOneDetector(app, db, threshold=int(os.environ.get('N_PLUS_ONE_THRESHOLD', 5)),
+                                           mode=os.environ['N_PLUS_ONE'])
+
+# 请求中第一次执行SQL时才从连接池取出连接（peewee 自动连接），结束时归还；
+# 不访问数据库的请求（静态文件、内存中的考试列表、304 响应）不占用连接，也不产生检查连接的往返
+@app.teardown_request
+def close_db_connection(exc):
+    if not db.is_closed():
+        db.close()
+
+# 每个请求记录一条访问日志，格式与开发服务器的访问日志一致，并在状态码后附上 session 中的操作人，
+# 日志检索可按学生、教师、管理员查到其访问的路由；学生为 Students 主键，与其他日志中的学生标识一致
+@app.after_request
+def log_access(response):
+    actors = []
+    if 'student_id' in session:
+        actors.append(f"student {session['student_id']}")
+    if 'teacher_id' in session:
+        actors.append(f"teacher '{session['teacher_id']}'")
+    if 'admin_id' in session:
+        actors.append(f"admin '{session['admin_id']}'")
+    path = request.full_path if request.query_string else request.path
+    logger.info(f'{request.remote_addr} "{request.method} {path} {request.environ.get("SERVER_PROTOCOL", "HTTP/1.1")}" '
+                f'{response.status_code} {" ".join(actors) or "-"}')
+    return response
+
+
+class DevServerAccessFilter(logging.Filter):
+    """
+    去掉开发服务器（werkzeug）自带的访问日志，同一请求只保留 log_access 记录的一条。
+    """
+
+    def filter(self, record):
+        return not (isinstance(record.msg, str) and record.msg.endswith('"%s" %s %s'))
+
+
+logging.getLogger('werkzeug').addFilter(DevServerAccessFilter())
 
 student_module = StudentModule()
 teacher_module = TeacherModule()
 admin_module = AdminModule()
 
+# 交卷写缓冲（默认关闭，设置环境变量 WRITE_BEHIND=1 开启），启动时重放已退出进程未入库的提交
+if os.environ.get('WRITE_BEHIND', '0') == '1' and SERVING_PROCESS:
+    student_module.submission_buffer = SubmissionBuffer(
+        student_module.store_submissions,
+        journal_dir=os.environ.get('WRITE_BEHIND_JOURNAL_DIR', './journal')
+    )
+    student_module.submission_buffer.start()
+    atexit.register(student_module.submission_buffer.stop)
+
+# 题库导入在后台线程中执行，并发导入数由环境变量 IMPORT_WORKERS 配置；
+# 默认每批题目单独提交，设置 IMPORT_ALL_OR_NOTHING=1 时识别完整个文件后在一个事务中写入
+import_jobs = ImportJobRunner(teacher_module.import_question_bank, max_workers=int(os.environ.get('IMPORT_WORKERS', 2)),
+                              all_or_nothing=os.environ.get('IMPORT_ALL_OR_NOTHING', '0') == '1')
+
 # 首页
 @app.route('/')
 def home():
@@ -79,10 +154,23 @@ def student_login():
 @app.route('/student/logout', methods=['GET'])
 def student_logout():
     # 注销时清除 session 中的 student_id
-    session.pop('student_id', None)
-    result = student_module.logout()
+    result = student_module.logout(session.pop('student_id', None))
     return render_template('index.html')
 
+def not_modified(etag):
+    """
+    客户端缓存的 ETag 与当前版本一致时返回 304 响应，否则返回 None。
+    """
+    if etag in request.if_none_match:
+        return with_etag(app.response_class(status=304), etag)
+    return None
+
+def with_etag(response, etag):
+    # 要求客户端每次都携带 If-None-Match 重新验证
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
 # 参加考试页面
 @app.route('/student/exam_list', methods=['GET'])
 def exam_list():
@@ -104,7 +192,11 @@ def exam_list():
     if result["status"] == "success":
         exams = result["exams"]
         if is_miniprogram:
-            return jsonify({"status": "success", "exams": exams}), 200
+            etag = f'exams-{result["version"]}'
+            cached = not_modified(etag)
+            if cached:
+                return cached
+            return with_etag(jsonify({"status": "success", "exams": exams}), etag), 200
         else:
             return render_template('student_exam_list.html', exams=exams)
     else:
@@ -122,6 +214,75 @@ app.jinja_env.filters['char_from_index'] = char_from_index
 # 参加特定考试页面
 from flask import jsonify
 
+def parse_exam_answers(paper, data, is_miniprogram):
+    """
+    按试卷解析并校验提交的答案，只处理提交中出现的题目。
+    提交了字段但值为空（取消所选选项、清空文本）的题目记为 None，保存时删除该题已保存的答案。
+    :return: (answers, error_msg)，校验失败时 error_msg 不为空
+    """
+    answers = {}
+    for question in paper.questions:
+        # 构建选项ID到字母映射，例如：{72: "A", 73: "B", ...}
+        option_map = {opt.id: chr(65 + i) for i, opt in enumerate(question.options)}
+
+        if question.question_type in ['单选题', '判断题']:
+            selected_value = data.get(f'question_{question.id}')
+            if selected_value:
+                # 使用试卷快照中的选项索引校验，选项必须属于本题
+                option_id = paper.resolve_option(question.id, selected_value)
+                if not option_id:
+                    return answers, "选项无效"
+                # 使用映射将选项ID转换为字母
+                answer_text = option_map.get(option_id, "")
+                answers[question.id] = {"selected_option_id": option_id, "answer_text": answer_text}
+            elif f'question_{question.id}' in data:
+                answers[question.id] = None
+
+        elif question.question_type == '多选题':
+            selected_values = data.getlist(f'question_{question.id}') if not is_miniprogram else data.get(f'question_{question.id}', [])
+            if selected_values:
+                selected_option_ids = []
+                selected_option_texts = []
+                for option_id in selected_values:
+                    if not paper.resolve_option(question.id, option_id):
+                        return answers, "多选题的选项无效"
+                    selected_option_ids.append(str(option_id))
+                    selected_option_texts.append(str(option_id))
+                answers[question.id] = {
+                    "selected_option_id": ",".join(selected_option_ids),
+                    "answer_text": ",".join(selected_option_texts)  # 返回选项字母，以逗号分隔
+                }
+            elif f'question_{question.id}' in data:
+                answers[question.id] = None
+        else:
+            answer_text = data.get(f'question_{question.id}_text')
+            if answer_text:
+                answers[question.id] = {"answer_text": answer_text}
+            elif f'question_{question.id}_text' in data:
+                answers[question.id] = None
+    return answers, None
+
+def answers_to_form(paper, submitted):
+    """
+    把小程序提交的 {"answers": {题目ID: {"selected_option_id", "answer_text"}}} 转换为 question_<ID> 格式，
+    再交给 parse_exam_answers 按试卷校验；不属于本试卷的题目直接忽略。
+    """
+    form = {}
+    if not isinstance(submitted, dict):
+        return form
+    for question in paper.questions:
+        answer = submitted.get(str(question.id)) or submitted.get(question.id)
+        if not isinstance(answer, dict):
+            continue
+        if question.question_type in ['单选题', '判断题']:
+            form[f'question_{question.id}'] = answer.get('selected_option_id')
+        elif question.question_type == '多选题':
+            selected = answer.get('selected_option_id')
+            form[f'question_{question.id}'] = [value for value in str(selected).split(',') if value] if selected else []
+        else:
+            form[f'question_{question.id}_text'] = answer.get('answer_text')
+    return form
+
 @app.route('/student/exam/<int:exam_id>', methods=['GET', 'POST'])
 def take_exam(exam_id):
     # 检查是否为小程序请求
@@ -137,78 +298,41 @@ def take_exam(exam_id):
         else:
             return redirect(url_for('student_login'))
 
-    # 获取考试信息
-    exam = Exams.get_or_none(Exams.id == exam_id)
-    if not exam:
+    # 获取考试及试题信息（同一考试共享缓存的试卷快照）
+    paper = paper_cache.get(exam_id)
+    if not paper:
         if is_miniprogram:
             return jsonify({"status": "fail", "message": "考试不存在"}), 404
         else:
             return "考试不存在", 404
-
-    # 获取试题信息
-    exam_questions = ExamQuestions.select().where(ExamQuestions.exam == exam)
-    questions = [eq.question for eq in exam_questions]
+    exam = paper.exam
+    questions = paper.questions
     
     # 获取学生的答案
     student_answers = {}
     if 'student_id' in session:
         student_id = session['student_id']
-        answers = StudentAnswers.select().where(
+        answers = StudentAnswers.select(
+            StudentAnswers.question, StudentAnswers.selected_option, StudentAnswers.answer_text
+        ).where(
             (StudentAnswers.student_id == student_id) & 
             (StudentAnswers.exam_id == exam_id)
         )
         for answer in answers:
-            student_answers[answer.question.id] = answer.selected_option.id if answer.selected_option else answer.answer_text
+            student_answers[answer.question_id] = answer.selected_option_id if answer.selected_option_id else answer.answer_text
 
     # 处理 POST 请求，即学生提交答案
     if request.method == 'POST':
         data = request.get_json() if is_miniprogram else request.form  # 根据请求来源选择解析方式
-        answers = {}
-        if 'answers' in data:
-            answers = data['answers']
-        for question in questions:
-            # 构建选项ID到字母映射，例如：{72: "A", 73: "B", ...}
-            option_map = {opt.id: chr(65 + i) for i, opt in enumerate(question.options)}
-
-            if question.question_type in ['单选题', '判断题']:
-                selected_value = data.get(f'question_{question.id}')
-                if selected_value:
-                    option = QuestionOptions.get_or_none(QuestionOptions.id == selected_value)
-                    if option:
-                        # 使用映射将选项ID转换为字母
-                        answer_text = option_map.get(int(selected_value), "")
-                        answers[question.id] = {"selected_option_id": int(selected_value), "answer_text": answer_text}
-                    else:
-                        error_msg = "选项无效"
-                        if is_miniprogram:
-                            return jsonify({"status": "fail", "message": error_msg})
-                        else:
-                            return render_template('student_take_exam.html', exam=exam, questions=questions, student_answers=student_answers, error=error_msg)
-
-            elif question.question_type == '多选题':
-                selected_values = data.getlist(f'question_{question.id}') if not is_miniprogram else data.get(f'question_{question.id}', [])
-                if selected_values:
-                    selected_option_ids = []
-                    selected_option_texts = []
-                    for option_id in selected_values:
-                        option = QuestionOptions.get_or_none(QuestionOptions.id == option_id)
-                        if option:
-                            selected_option_ids.append(option_id)
-                            selected_option_texts.append(option_id)
-                        else:
-                            error_msg = "多选题的选项无效"
-                            if is_miniprogram:
-                                return jsonify({"status": "fail", "message": error_msg})
-                            else:
-                                return render_template('student_take_exam.html', exam=exam, questions=questions, student_answers=student_answers, error=error_msg)
-                    answers[question.id] = {
-                        "selected_option_id": ",".join(selected_option_ids),
-                        "answer_text": ",".join(selected_option_texts)  # 返回选项字母，以逗号分隔
-                    }
+        if is_miniprogram and 'answers' in data:
+            # 小程序按题目ID提交的答案同样经过试卷校验，question_<ID> 格式的字段优先
+            data = {**answers_to_form(paper, data['answers']), **data}
+        answers, error_msg = parse_exam_answers(paper, data, is_miniprogram)
+        if error_msg:
+            if is_miniprogram:
+                return jsonify({"status": "fail", "message": error_msg})
             else:
-                answer_text = data.get(f'question_{question.id}_text')
-                if answer_text:
-                    answers[question.id] = {"answer_text": answer_text}
+                return render_template('student_take_exam.html', exam=exam, questions=questions, student_answers=student_answers, error=error_msg)
         result = student_module.submit_exam_answers(session['student_id'], exam_id, answers)
         if result["status"] == "success":
             if is_miniprogram:
@@ -224,6 +348,13 @@ def take_exam(exam_id):
 
     # GET 请求，返回考试详情
     if is_miniprogram:
+        # 试卷版本和学生答案都未变化时直接返回 304，不再生成试卷 JSON
+        answers_digest = hashlib.sha1(json.dumps(sorted(student_answers.items())).encode('utf-8')).hexdigest()[:16]
+        etag = f'paper-{paper.version}-{answers_digest}'
+        cached = not_modified(etag)
+        if cached:
+            return cached
+
         question_data = [
             {
                 "id": question.id,
@@ -234,16 +365,49 @@ def take_exam(exam_id):
             for question in questions
         ]
 
-        return jsonify({
+        return with_etag(jsonify({
             "status": "success",
             "exam": {"id": exam.id, "title": exam.name},
             "questions": question_data,
             "student_answers": student_answers
-        })
+        }), etag)
     else:
         return render_template('student_take_exam.html', exam=exam, questions=questions, student_answers=student_answers)
 
 
+# 小程序增量保存答案：只提交自上次同步以来修改过的题目
+@app.route('/student/exam/<int:exam_id>/autosave', methods=['POST'])
+def autosave_exam_answers(exam_id):
+    session_id = request.headers.get('Authorization')
+    if session_id:
+        session['student_id'] = session_id
+    if 'student_id' not in session:
+        return jsonify({"status": "fail", "message": "未登录"}), 401
+
+    paper = paper_cache.get(exam_id)
+    if not paper:
+        return jsonify({"status": "fail", "message": "考试不存在"}), 404
+
+    data = request.get_json(silent=True) or {}
+    seq = data.get('seq')
+    if not isinstance(seq, int) or isinstance(seq, bool) or seq < 0:
+        return jsonify({"status": "fail", "message": "同步序号无效"}), 400
+
+    # 格式与整卷提交相同，例如 {"seq": 3, "question_12": 45, "question_13": [46, 47], "question_14_text": "..."}，
+    # 或小程序交卷使用的 {"seq": 3, "answers": {"12": {"selected_option_id": 45, "answer_text": 45}}}
+    if 'answers' in data:
+        data = {**answers_to_form(paper, data['answers']), **data}
+    answers, error_msg = parse_exam_answers(paper, data, is_miniprogram=True)
+    if error_msg:
+        return jsonify({"status": "fail", "message": error_msg}), 400
+
+    result = student_module.save_answer_delta(session['student_id'], exam_id, seq, answers)
+    if result["status"] == "success":
+        return jsonify({"status": "success", "seq": result["seq"], "applied": result["applied"]})
+    else:
+        return jsonify({"status": "fail", "message": result["message"]}), 400
+
+
 
 
 
@@ -289,8 +453,7 @@ def teacher_login():
 @app.route('/teacher/logout', methods=['GET'])
 def teacher_logout():
     # 清除 session 中的 teacher_id
-    session.pop('teacher_id', None)
-    result = teacher_module.logout()
+    result = teacher_module.logout(session.pop('teacher_id', None))
     return render_template('index.html')
 
 # 教师仪表盘
@@ -317,6 +480,7 @@ def manage_question_banks():
             # 删除题库
             question_bank = QuestionBanks.get(QuestionBanks.id == question_bank_id)
             question_bank.delete_instance()
+            invalidate_exam_caches()
             return redirect(url_for('manage_question_banks'))
 
     # 获取题库列表
@@ -362,6 +526,9 @@ def edit_question(question_bank_id, question_id):
         options = QuestionOptions.select().where(QuestionOptions.question == question_id)
         return render_template('edit_question.html', question_bank=question_bank, question=question, options=options)
 
+# 题目明细每页显示的题目数
+QUESTIONS_PER_PAGE = 50
+
 # 题目明细
 @app.route('/teacher/question_bank/<int:question_bank_id>', methods=['GET', 'POST'])
 def question_bank_details(question_bank_id):
@@ -377,15 +544,15 @@ def question_bank_details(question_bank_id):
             if not file:
                 return jsonify({"status": "error", "message": "No file provided"}), 400
             
-            temp_dir = tempfile.gettempdir()
-            file_path = os.path.join(temp_dir, file.filename)
+            # 使用唯一的临时文件名，保留扩展名用于选择解析器；文件由导入任务结束时删除
+            fd, file_path = tempfile.mkstemp(suffix=os.path.splitext(file.filename)[1].lower())
+            os.close(fd)
             file.save(file_path)
-            
-            result = teacher_module.import_question_bank(file_path, question_bank_id)
-            if os.path.exists(file_path):
-                os.remove(file_path)
 
-            return redirect(url_for('question_bank_details', question_bank_id=question_bank_id))
+            job_id = import_jobs.submit(file_path, question_bank_id, filename=file.filename)
+            if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+                return jsonify({"status": "success", "job_id": job_id}), 202
+            return redirect(url_for('question_bank_details', question_bank_id=question_bank_id, import_job=job_id))
         
         elif action == 'add_question':
             question_type = request.form['question_type']
@@ -415,6 +582,7 @@ def question_bank_details(question_bank_id):
             question_id = request.form['question_id']
             question = Questions.get(Questions.id == question_id)
             question.delete_instance(recursive=True)
+            invalidate_exam_caches()
             return redirect(url_for('question_bank_details', question_bank_id=question_bank_id))
         
         elif action == 'edit_question':
@@ -434,19 +602,53 @@ def question_bank_details(question_bank_id):
                         option_text=option_text,
                         is_correct=(str(index) in correct_options)
                     )
+            invalidate_exam_caches()
             
             return redirect(url_for('question_bank_details', question_bank_id=question_bank_id))
 
-    questions = Questions.select().where(Questions.question_bank == question_bank)
-    question_data = []
-    for question in questions:
-        options = QuestionOptions.select().where(QuestionOptions.question == question)
-        question_data.append({
-            'question': question,
-            'options': options
-        })
-    
-    return render_template('question_bank_details.html', question_bank=question_bank, question_data=question_data)
+    # 按题目ID游标分页：after 取下一页，before 取上一页，可按题型筛选
+    question_type = request.args.get('question_type') or None
+    after = request.args.get('after', type=int)
+    before = request.args.get('before', type=int)
+    query = Questions.select().where(Questions.question_bank == question_bank)
+    if question_type:
+        query = query.where(Questions.question_type == question_type)
+    if before is not None:
+        query = query.where(Questions.id < before).order_by(Questions.id.desc())
+    else:
+        if after is not None:
+            query = query.where(Questions.id > after)
+        query = query.order_by(Questions.id)
+    questions = list(query.limit(QUESTIONS_PER_PAGE + 1))
+    has_more = len(questions) > QUESTIONS_PER_PAGE
+    questions = questions[:QUESTIONS_PER_PAGE]
+    if before is not None:
+        questions.reverse()
+
+    # 一次查询取出本页所有题目的选项
+    options_by_question = {question.id: [] for question in questions}
+    if questions:
+        options = QuestionOptions.select().where(QuestionOptions.question.in_(list(options_by_question))).order_by(QuestionOptions.id)
+        for option in options:
+            options_by_question[option.question_id].append(option)
+    question_data = [{'question': question, 'options': options_by_question[question.id]} for question in questions]
+
+    # 向后翻页时一定存在下一页，向前翻页时一定存在上一页
+    next_cursor = questions[-1].id if questions and (has_more or before is not None) else None
+    prev_cursor = questions[0].id if questions and (after is not None or (before is not None and has_more)) else None
+    return render_template('question_bank_details.html', question_bank=question_bank, question_data=question_data,
+                           question_type=question_type, next_cursor=next_cursor, prev_cursor=prev_cursor,
+                           import_job=request.args.get('import_job'))
+
+# 题库导入任务进度
+@app.route('/teacher/import_job/<job_id>', methods=['GET'])
+def import_job_status(job_id):
+    if 'teacher_id' not in session:
+        return jsonify({"status": "error", "message": "未登录"}), 401
+    job = import_jobs.status(job_id)
+    if not job:
+        return jsonify({"status": "error", "message": "Import job not found"}), 404
+    return jsonify(job)
 
 # 考试管理页面
 @app.route('/teacher/manage_exams', methods=['GET'])
@@ -607,16 +809,7 @@ def grade_exam(exam_id):
                 )
 
         # 计算并保存学生的总成绩
-        total_grade = sum(grades.values())
-
-        student_grade, created = StudentGrades.get_or_create(
-            student=student,
-            exam=exam,
-            defaults={'grade': total_grade}
-        )
-        if not created:
-            student_grade.grade = total_grade
-            student_grade.save()
+        teacher_module.calculate_and_save_total_grades(exam_id, student_ids=[student.id])
 
         return redirect(url_for('grade_exam', exam_id=exam_id, student_id=student_id))
 
@@ -704,8 +897,7 @@ def admin_login():
 @app.route('/admin/logout', methods=['GET'])
 def admin_logout():
     # 清除 session 中的 admin_id
-    session.pop('admin_id', None)
-    result = admin_module.logout()
+    result = admin_module.logout(session.pop('admin_id', None))
     return render_template('index.html')
 
 # 管理员仪表盘
@@ -729,18 +921,69 @@ def manage_teachers():
         return redirect(url_for('admin_login'))
     return render_template('admin_manage_teachers.html')
 
+# 日志页面每页显示的日志条数
+LOG_LINES_PER_PAGE = 200
+log_reader = LogReader()
+
 # 系统日志查看页面
 @app.route('/admin/view_logs', methods=['GET'])
 def view_logs():
     if 'admin_id' not in session:
         return redirect(url_for('admin_login'))
-    try:
-        local_date = datetime.strftime(datetime.now(),"%Y%m%d")
-        with open(f'./logs/{local_date}.log', 'r') as f:
-            logs = f.readlines()
-        return render_template('admin_view_logs.html', logs=logs)
-    except FileNotFoundError:
+    # 默认查看当天的日志，可选择其他日期，并按级别和文本筛选
+    local_date = datetime.strftime(datetime.now(),"%Y%m%d")
+    date = request.args.get('date') or local_date
+    level = request.args.get('level') or None
+    text = request.args.get('q') or None
+    page = max(request.args.get('page', 1, type=int), 1)
+    end = request.args.get('end', type=int)
+    if level not in LOG_LEVELS:
+        level = None
+
+    result = log_reader.read_page(date, page=page, per_page=LOG_LINES_PER_PAGE, level=level, text=text, end=end)
+    if result is None:
         return "日志文件不存在"
+    return render_template('admin_view_logs.html', records=result['records'], page=page, end=result['end'],
+                           has_more=result['has_more'], date=date, dates=log_reader.log_dates(),
+                           level=level, levels=LOG_LEVELS, q=text or '')
+
+# 日志索引，后台每隔 LOG_INDEX_INTERVAL 秒索引新追加的日志（设为 0 时只在检索时更新）
+log_index = LogIndex()
+if int(os.environ.get('LOG_INDEX_INTERVAL', 60)) > 0 and SERVING_PROCESS:
+    log_index.start(int(os.environ.get('LOG_INDEX_INTERVAL', 60)))
+
+# 日志检索：按操作人、考试、题库、路由、状态码、级别和时间范围检索多天的日志
+@app.route('/admin/log_search', methods=['GET'])
+def log_search():
+    if 'admin_id' not in session:
+        return jsonify({"status": "error", "message": "未登录"}), 401
+    try:
+        start = datetime.strptime(request.args['from'], '%Y-%m-%d %H:%M') if request.args.get('from') else None
+        end = datetime.strptime(request.args['to'], '%Y-%m-%d %H:%M') if request.args.get('to') else None
+    except ValueError:
+        return jsonify({"status": "error", "message": "时间格式应为 YYYY-MM-DD HH:MM"}), 400
+    level = request.args.get('level') or None
+    if level and level not in LOG_LEVELS:
+        return jsonify({"status": "error", "message": "Invalid log level"}), 400
+    limit = min(max(request.args.get('limit', 100, type=int), 1), 1000)
+
+    # 先索引新追加的日志，保证检索结果包含最新的内容
+    log_index.update()
+    terms = {field: request.args.get(field) for field in SEARCH_FIELDS}
+    results = log_index.search(terms, level=level, start=start, end=end, limit=limit)
+    return jsonify({"status": "success", "count": len(results), "results": results})
+
+# Prometheus 采集时无法登录，可通过环境变量 METRICS_TOKEN 配置令牌，以 Authorization: Bearer <令牌> 访问
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+
+# 请求耗时和SQL统计，Prometheus 文本格式
+@app.route('/admin/metrics', methods=['GET'])
+def metrics():
+    authorization = request.headers.get('Authorization', '')
+    token_ok = bool(METRICS_TOKEN) and hmac.compare_digest(authorization, f'Bearer {METRICS_TOKEN}')
+    if 'admin_id' not in session and not token_ok:
+        return jsonify({"status": "error", "message": "未登录"}), 401
+    return request_metrics.render(), 200, {'Content-Type': PROMETHEUS_CONTENT_TYPE}
 
 # 查询教师账户
 @app.route('/admin/search_teacher', methods=['POST'])
@@ -0,0 +1,127 @@
+# check_query_plans.py
+"""
+查询计划检查工具：在测试库上走一遍主要页面和批改、交卷流程，
+记录 methods.py 与 api.py 实际发出的 SQL，对每种 SQL 执行 EXPLAIN，
+发现全表扫描时列出并以非零状态码退出，便于在上线前发现缺失的索引。
+
+用法：
+    python check_query_plans.py [--min-rows 1000]
+写操作（自动批改、交卷）在事务中执行并回滚，不会修改数据库中的数据。
+"""
+import argparse
+import logging
+import sys
+from api import app, student_module, teacher_module
+from exam_cache import invalidate_exam_caches
+from models import db, Exams, QuestionBanks, Questions, StudentAnswers, Students
+
+
+class QueryRecorder(logging.Handler):
+    """
+    从 peewee 的调试日志中收集执行过的 SQL，按语句文本去重。
+    """
+
+    def __init__(self):
+        super().__init__(level=logging.DEBUG)
+        self.queries = {}
+
+    def emit(self, record):
+        if isinstance(record.msg, tuple) and len(record.msg) == 2:
+            sql, params = record.msg
+            self.queries.setdefault(sql, params)
+
+
+def run_scenario():
+    """
+    使用库中已有的数据调用主要的只读页面，以及回滚事务中的批改和交卷流程。
+    """
+    exam = Exams.select().first()
+    question_bank = QuestionBanks.select().first()
+    student_answer = StudentAnswers.select().where(StudentAnswers.exam == exam).first() if exam else None
+    student = student_answer.student if student_answer else Students.select().first()
+    if not exam or not question_bank or not student:
+        raise SystemExit("测试库中至少需要一场考试、一个题库和一名学生")
+
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['student_id'] = student.id
+        session['teacher_id'] = 'query-plan-check'
+        session['admin_id'] = 'query-plan-check'
+    miniprogram = {'X-Requested-By': 'WechatMiniProgram'}
+    for url, headers in [
+        ('/student/exam_list', miniprogram),
+        (f'/student/exam/{exam.id}', miniprogram),
+        (f'/student/exam/{exam.id}', {}),
+        (f'/teacher/question_bank/{question_bank.id}', {}),
+        ('/teacher/manage_exams', {}),
+        (f'/teacher/edit_exam/{exam.id}', {}),
+        (f'/teacher/grade_exam/{exam.id}?student_id={student.id}', {}),
+        (f'/teacher/view_grades/{exam.id}', {}),
+        (f'/teacher/exam_report/{exam.id}', {}),
+    ]:
+        response = client.get(url, headers=headers)
+        if response.status_code >= 500:
+            print(f"警告：{url} 返回 {response.status_code}")
+
+    question = Questions.select().where(Questions.question_bank == exam.question_bank).first()
+    answers = {question.id: {"answer_text": "query plan check"}} if question else {}
+    with db.connection_context():
+        with db.atomic() as transaction:
+            teacher_module.auto_grade_exam(exam.id)
+            student_module.submit_exam_answers(student.id, exam.id, answers)
+            student_module.save_answer_delta(student.id, exam.id, 0, answers)
+            transaction.rollback()
+
+
+def explain(sql, params):
+    """
+    执行 EXPLAIN 并以字典列表返回每一行计划。
+    """
+    cursor = db.execute_sql(f'EXPLAIN {sql}', params)
+    columns = [column[0] for column in cursor.description]
+    return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+
+def check_query_plans(min_rows=0):
+    """
+    :param min_rows: 只报告预计扫描行数不少于该值的全表扫描，用于忽略小表
+    :return: [(sql, plan_row)] 发现的全表扫描
+    """
+    invalidate_exam_caches()
+    recorder = QueryRecorder()
+    peewee_logger = logging.getLogger('peewee')
+    previous_level, previous_propagate = peewee_logger.level, peewee_logger.propagate
+    # 只收集，不把 SQL 写入系统日志
+    peewee_logger.setLevel(logging.DEBUG)
+    peewee_logger.propagate = False
+    peewee_logger.addHandler(recorder)
+    try:
+        run_scenario()
+    finally:
+        peewee_logger.removeHandler(recorder)
+        peewee_logger.setLevel(previous_level)
+        peewee_logger.propagate = previous_propagate
+
+    full_scans = []
+    with db.connection_context():
+        for sql, params in recorder.queries.items():
+            # INSERT 不涉及扫描，事务控制语句无法 EXPLAIN
+            if not sql.lstrip().upper().startswith(('SELECT', 'UPDATE', 'DELETE')):
+                continue
+            for row in explain(sql, params):
+                if row.get('type') == 'ALL' and (row.get('rows') or 0) >= min_rows:
+                    full_scans.append((sql, row))
+    print(f"共检查 {len(recorder.queries)} 种 SQL，发现 {len(full_scans)} 处全表扫描")
+    return full_scans
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="对应用发出的 SQL 执行 EXPLAIN 并报告全表扫描")
+    parser.add_argument('--min-rows', type=int, default=0, help="忽略预计扫描行数小于该值的全表扫描")
+    args = parser.parse_args()
+
+    full_scans = check_query_plans(args.min_rows)
+    for sql, row in full_scans:
+        print(f"\n[全表扫描] 表 {row.get('table')}，预计扫描 {row.get('rows')} 行")
+        print(f"  {sql}")
+    sys.exit(1 if full_scans else 0)
@@ -1,86 +1,122 @@
 # check_docx_questions.py
-import json
-import re
-from openai import OpenAI
-from docx import Document
+from functools import partial
+from xml.etree import ElementTree
+import zipfile
+from check_questions.llm_recognizer import (QuestionRecognizer, SkippedQuestions, build_batch_prompt, build_prompt,
+                                             is_json_response, parse_question_reply)
 
-client = OpenAI(api_key="", base_url="https://api.deepseek.com")
+# 提示词版本，修改 Word 导入的提示词时递增（见 llm_recognizer.PROMPT_RULES）
+PROMPT_VERSION = 'docx-1'
+# 提示词中对选择题的称呼
+CHOICE_TYPES = '单选题、多选题题'
+
+# 流式读取文档时每次识别的题目数
+RECOGNIZE_CHUNK_SIZE = 100
+
+# WordprocessingML 元素名
+W_NAMESPACE = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+W_BODY, W_P, W_TBL = W_NAMESPACE + 'body', W_NAMESPACE + 'p', W_NAMESPACE + 'tbl'
+W_T, W_TAB, W_BR, W_CR = W_NAMESPACE + 't', W_NAMESPACE + 'tab', W_NAMESPACE + 'br', W_NAMESPACE + 'cr'
 
 class DocxQuestionImporter:
-    def __init__(self):
-        pass
+    def __init__(self, recognizer=None):
+        self.recognizer = recognizer or QuestionRecognizer()
+        # 已从文档中读取的题目数，用于估算导入进度
+        self.questions_read = 0
+        # 识别失败或内容不完整而跳过的题目
+        self.skipped = SkippedQuestions()
 
     def import_question_bank(self, file_path):
+        return list(self.iter_questions(file_path))
+
+    def iter_questions(self, file_path, chunk_size=RECOGNIZE_CHUNK_SIZE):
+        """
+        边读取文档边识别，每凑满 chunk_size 道题识别一次并逐题返回结果。
+        """
         if not file_path.endswith('.docx'):
             raise ValueError("仅支持 Word 文件格式 (.docx)")
 
-        questions = self._read_from_word(file_path)
-        results = []
-
-        for question_text in questions:
-            prompt = (
-                f"请识别以下完整问题的详细内容，并以 JSON 格式输出，不要包含 ``` 标记。"
-                f"答案中有多个选项的都为多选题\n"
-                f"判断题选项应使用 '对、错' 格式，并在答案中使用对应的对、错。\n"
-                f"单选题、多选题题选项应使用 'A、B、C...' 格式，并在答案中使用对应的字母。例如：答案应为 'A' 或 'A, B'.....。全都使用大写字母\n"
-                f"结构如下：\n"
-                f"{{'question_type': '', 'content': '', 'answer': '', 'options': [{{'text': '', 'is_correct': true/false}}]}}\n"
-                f"完整问题：\n{question_text}"
-            )
+        questions = []
+        for question_text in self._iter_word_questions(file_path):
+            questions.append(question_text)
+            if len(questions) >= chunk_size:
+                yield from self._recognize_questions(questions)
+                questions = []
+        if questions:
+            yield from self._recognize_questions(questions)
 
-            response = client.chat.completions.create(
-                model="deepseek-chat",
-                messages=[
-                    {"role": "system", "content": "You are a helpful assistant"},
-                    {"role": "user", "content": prompt},
-                ],
-                stream=False
-            )
-            
-            content = response.choices[0].message.content.strip()
-            content = self.clean_non_standard_json(content)
-            try:
-                recognized_data = json.loads(content)
+    def _recognize_questions(self, questions):
+        results = []
 
-                # 检查题目内容是否完整
-                if recognized_data['question_type'] in ['单选题', '多选题', '判断题']:
-                    # 如果没有选项或没有答案，跳过此题
-                    # print(recognized_data.get('options'))
-                    if not recognized_data.get('options') or not recognized_data.get('answer').strip():
-                        # print("题目缺少选项或答案，跳过此题。")
-                        continue
-                
-                if not recognized_data['content'].strip():
-                    # print("题目内容缺失，跳过此题。")
-                    continue
-                
-                results.append(recognized_data)
-            except json.JSONDecodeError:
-                print("识别结果解析失败，跳过此题：", content)
+        # 已识别过的题目直接取缓存结果，其余并发识别，返回顺序与文档中的题目顺序一致
+        contents = self.recognizer.recognize_questions(
+            questions, partial(build_prompt, choice_types=CHOICE_TYPES), PROMPT_VERSION, accept=is_json_response,
+            build_batch_prompt=partial(build_batch_prompt, choice_types=CHOICE_TYPES))
+        # 本批第一题在文档中的序号
+        first = self.questions_read - len(questions) + 1
+        for number, content in enumerate(contents, first):
+            recognized_data, reason = parse_question_reply(content)
+            if reason:
+                self.skipped.add(f"第 {number} 题", reason)
+                continue
+            results.append(recognized_data)
 
         return results
 
-    def clean_non_standard_json(self, content):
-        content = content.replace("'", '"')
-        content = re.sub(r'\btrue\b', 'true', content, flags=re.IGNORECASE)
-        content = re.sub(r'\bfalse\b', 'false', content, flags=re.IGNORECASE)
-        return content
-
     def _read_from_word(self, file_path):
-        document = Document(file_path)
-        questions = []
-        
+        return list(self._iter_word_questions(file_path))
+
+    def _iter_word_questions(self, file_path):
+        """
+        逐段读取正文，以空段落分隔题目，每读完一道题立即返回。
+        """
         current_question = ""
-        for para in document.paragraphs:
-            text = para.text.strip()
+        for text in self._iter_paragraph_texts(file_path):
+            text = text.strip()
             if text:
                 current_question += text + "\n"
             else:
                 if current_question:
-                    questions.append(current_question.strip())
+                    self.questions_read += 1
+                    yield current_question.strip()
                     current_question = ""
-        
+
         if current_question:
-            questions.append(current_question.strip())
-        
-        return questions
+            self.questions_read += 1
+            yield current_question.strip()
+
+    def _iter_paragraph_texts(self, file_path):
+        """
+        用 iterparse 流式解析 word/document.xml，按顺序返回正文中每个段落的文本（不含表格内的段落，
+        与 python-docx 的 Document.paragraphs 一致）。已处理的元素随即释放，内存占用与文档大小无关。
+        """
+        with zipfile.ZipFile(file_path) as archive, archive.open('word/document.xml') as document:
+            body, paragraph_depth, table_depth, text = None, 0, 0, []
+            for event, element in ElementTree.iterparse(document, events=('start', 'end')):
+                tag = element.tag
+                if event == 'start':
+                    if tag == W_BODY:
+                        body = element
+                    elif tag == W_P:
+                        paragraph_depth += 1
+                    elif tag == W_TBL:
+                        table_depth += 1
+                    continue
+
+                if table_depth == 0 and paragraph_depth == 1:
+                    if tag == W_T:
+                        text.append(element.text or '')
+                    elif tag == W_TAB:
+                        text.append('\t')
+                    elif tag in (W_BR, W_CR):
+                        text.append('\n')
+                if tag == W_P:
+                    paragraph_depth -= 1
+                    if table_depth == 0 and paragraph_depth == 0:
+                        yield ''.join(text)
+                        text = []
+                elif tag == W_TBL:
+                    table_depth -= 1
+                # 正文下的一个段落或表格处理完毕后释放已解析的元素
+                if body is not None and table_depth == 0 and paragraph_depth == 0 and tag in (W_P, W_TBL):
+                    body.clear()
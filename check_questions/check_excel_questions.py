@@ -1,76 +1,109 @@
 # check_excel_questions.py
-import json
-import re
+from functools import partial
+import openpyxl
 import pandas as pd
-from openai import OpenAI
+from check_questions.llm_recognizer import (QuestionRecognizer, SkippedQuestions, build_batch_prompt, build_prompt,
+                                             is_json_response, parse_question_reply)
+from check_questions.tabular_parser import parse_structured_sheet
 
-client = OpenAI(api_key="", base_url="https://api.deepseek.com")
+# 提示词版本，修改表格导入的提示词时递增（见 llm_recognizer.PROMPT_RULES）
+PROMPT_VERSION = 'excel-1'
+# 提示词中对选择题的称呼
+CHOICE_TYPES = '选择题'
+
+# 流式读取表格时每块的行数
+READ_CHUNK_ROWS = 2000
 
 class ExcelQuestionImporter:
-    def __init__(self):
-        pass
+    def __init__(self, recognizer=None):
+        self.recognizer = recognizer or QuestionRecognizer()
+        # 识别失败或内容不完整而跳过的题目
+        self.skipped = SkippedQuestions()
 
     def recognize_tabular_questions(self, file_path):
         """
         识别 Excel 文件中的题目内容，返回一个包含结构化数据的列表。
         """
-        if file_path.endswith('.xlsx'):
-            data = pd.read_excel(file_path)
-        elif file_path.endswith('.csv'):
-            data = pd.read_csv(file_path)
-        else:
-            raise ValueError("不支持的文件类型。仅支持 .xlsx 和 .csv 文件。")
+        return list(self.iter_tabular_questions(file_path))
 
-        results = []
-        for _, row in data.iterrows():
-            question_text = ' '.join(str(cell) for cell in row if pd.notna(cell)).strip()
-            
-            prompt = (
-                f"请识别以下完整问题的详细内容，并以 JSON 格式输出，不要包含 ``` 标记。"
-                f"答案中有多个选项的都为多选题\n"
-                f"判断题选项应使用 '对、错' 格式，并在答案中使用对应的对、错。\n"
-                f"选择题选项应使用 'A、B、C...' 格式，并在答案中使用对应的字母。例如：答案应为 'A' 或 'A, B'.....。全都使用大写字母\n"
-                f"结构如下：\n"
-                f"{{'question_type': '', 'content': '', 'answer': '', 'options': [{{'text': '', 'is_correct': true/false}}]}}\n"
-                f"完整问题：\n{question_text}"
-            )
+    def iter_tabular_questions(self, file_path, chunk_rows=READ_CHUNK_ROWS):
+        """
+        分块读取表格并逐题返回识别结果，读取下一块之前已识别的题目即可交给调用方写入，内存占用与文件大小无关。
+        """
+        if not (file_path.endswith('.xlsx') or file_path.endswith('.csv')):
+            raise ValueError("不支持的文件类型。仅支持 .xlsx 和 .csv 文件。")
+        for data in self.iter_sheet_chunks(file_path, chunk_rows):
+            yield from self._recognize_chunk(data)
 
-            response = client.chat.completions.create(
-                model="deepseek-chat",
-                messages=[
-                    {"role": "system", "content": "You are a helpful assistant"},
-                    {"role": "user", "content": prompt},
-                ],
-                stream=False
-            )
-            
-            content = response.choices[0].message.content.strip()
-            content = self.clean_non_standard_json(content)
+    def estimate_rows(self, file_path):
+        """
+        估算表格的数据行数（不含表头），用于显示导入进度：.xlsx 使用工作表记录的范围，.csv 统计换行符个数。
+        空行和单元格内的换行会使估算值偏大，无法估算时返回 0。
+        """
+        if file_path.endswith('.csv'):
+            with open(file_path, 'rb') as f:
+                lines = sum(block.count(b'\n') for block in iter(lambda: f.read(1024 * 1024), b''))
+            return max(lines - 1, 0)
+        workbook = openpyxl.load_workbook(file_path, read_only=True)
+        try:
+            max_row = workbook.active.max_row
+        finally:
+            workbook.close()
+        return max((max_row or 1) - 1, 0)
 
-            try:
-                recognized_data = json.loads(content)
+    def iter_sheet_chunks(self, file_path, chunk_rows=READ_CHUNK_ROWS):
+        """
+        以 DataFrame 分块返回表格内容，首行为表头，行索引在整个文件内连续。
+        .xlsx 使用 openpyxl 只读模式逐行读取，.csv 使用 pandas 分块读取。
+        """
+        if file_path.endswith('.csv'):
+            yield from pd.read_csv(file_path, chunksize=chunk_rows)
+            return
 
-                # 检查题目内容是否完整
-                if recognized_data['question_type'] in ['单选题', '多选题', '判断题']:
-                    # 如果没有选项或没有答案，跳过此题
-                    print(recognized_data.get('options'))
-                    if not recognized_data.get('options') or not recognized_data.get('answer').strip():
-                        print("题目缺少选项或答案，跳过此题。")
-                        continue
-                
-                if not recognized_data['content'].strip():
-                    print("题目内容缺失，跳过此题。")
+        workbook = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
+        try:
+            rows = workbook.active.iter_rows(values_only=True)
+            header = next(rows, None)
+            if header is None:
+                return
+            # 与 pandas.read_excel 一致，空表头命名为 "Unnamed: 列号"
+            columns = [str(name) if name is not None else f'Unnamed: {index}' for index, name in enumerate(header)]
+            chunk, start = [], 0
+            for row in rows:
+                if all(cell is None for cell in row):
                     continue
+                chunk.append(row[:len(columns)] + (None,) * (len(columns) - len(row)))
+                if len(chunk) >= chunk_rows:
+                    yield pd.DataFrame(chunk, columns=columns, index=range(start, start + len(chunk)))
+                    start += len(chunk)
+                    chunk = []
+            if chunk:
+                yield pd.DataFrame(chunk, columns=columns, index=range(start, start + len(chunk)))
+        finally:
+            workbook.close()
+
+    def _recognize_chunk(self, data):
+        # 表头规范的行直接按列解析，只有无法确定的行交给大模型识别
+        parsed, unparsed_index = parse_structured_sheet(data)
+        question_texts = [
+            ' '.join(str(cell) for cell in row if pd.notna(cell)).strip()
+            for _, row in data.loc[unparsed_index].iterrows()
+        ]
 
-                results.append(recognized_data)
-            except json.JSONDecodeError:
-                print("识别结果解析失败，跳过此题：", content)
-        
-        return results
+        results = parsed
+        # 已识别过的题目直接取缓存结果，其余并发识别，返回顺序与 question_texts 一致
+        contents = self.recognizer.recognize_questions(
+            question_texts, partial(build_prompt, choice_types=CHOICE_TYPES), PROMPT_VERSION, accept=is_json_response,
+            build_batch_prompt=partial(build_batch_prompt, choice_types=CHOICE_TYPES))
+        for index, content in zip(unparsed_index, contents):
+            recognized_data, reason = parse_question_reply(content)
+            if reason:
+                # 行索引从 0 开始且不含表头
+                self.skipped.add(f"第 {index + 2} 行", reason)
+                continue
+            results.append((index, recognized_data))
 
-    def clean_non_standard_json(self, content):
-        content = content.replace("'", '"')
-        content = re.sub(r'\btrue\b', 'true', content, flags=re.IGNORECASE)
-        content = re.sub(r'\bfalse\b', 'false', content, flags=re.IGNORECASE)
-        return content
+        # 按表格中的行顺序返回
+        results.sort(key=lambda item: item[0])
+        return [question for _, question in results]
 
@@ -0,0 +1,333 @@
+# llm_recognizer.py
+from concurrent.futures import ThreadPoolExecutor
+import json
+import logging
+import math
+import os
+import re
+import time
+from openai import OpenAI
+from check_questions.recognition_cache import RecognitionCache, cache_key
+
+logger = logging.getLogger(__name__)
+
+# 大模型接口配置，可通过环境变量覆盖；LLM_BASE_URL 也可指向本地的模拟服务用于测试
+LLM_API_KEY = os.environ.get('LLM_API_KEY', '')
+LLM_BASE_URL = os.environ.get('LLM_BASE_URL', 'https://api.deepseek.com')
+LLM_MODEL = os.environ.get('LLM_MODEL', 'deepseek-chat')
+LLM_MAX_WORKERS = int(os.environ.get('LLM_MAX_WORKERS', 8))
+LLM_TIMEOUT = float(os.environ.get('LLM_TIMEOUT', 60))
+LLM_MAX_RETRIES = int(os.environ.get('LLM_MAX_RETRIES', 3))
+# 批量识别时每个请求中题目原文的估算 token 数上限，设为 0 时每个请求只识别一道题
+LLM_BATCH_TOKENS = int(os.environ.get('LLM_BATCH_TOKENS', 2000))
+
+
+# 单题和批量识别共用的提示词说明，choice_types 为各导入器对选择题的称呼。
+# 识别结果按 (题目原文, 导入器的 PROMPT_VERSION, 模型) 缓存，修改提示词时需递增使用它的导入器的 PROMPT_VERSION，
+# 使缓存中的旧识别结果失效；PROMPT_VERSION 带导入器前缀，不同导入器的提示词不同，缓存互不共用
+PROMPT_RULES = (
+    "答案中有多个选项的都为多选题\n"
+    "判断题选项应使用 '对、错' 格式，并在答案中使用对应的对、错。\n"
+    "{choice_types}选项应使用 'A、B、C...' 格式，并在答案中使用对应的字母。例如：答案应为 'A' 或 'A, B'.....。全都使用大写字母\n"
+)
+QUESTION_STRUCTURE = "'question_type': '', 'content': '', 'answer': '', 'options': [{'text': '', 'is_correct': true/false}]"
+
+
+def build_prompt(question_text, choice_types):
+    """
+    单题识别的提示词，要求模型返回一个 JSON 对象。
+    """
+    return (
+        f"请识别以下完整问题的详细内容，并以 JSON 格式输出，不要包含 ``` 标记。"
+        f"{PROMPT_RULES.format(choice_types=choice_types)}"
+        f"结构如下：\n"
+        f"{{{QUESTION_STRUCTURE}}}\n"
+        f"完整问题：\n{question_text}"
+    )
+
+
+def build_batch_prompt(question_texts, choice_types):
+    """
+    批量识别的提示词，要求模型返回 JSON 数组，元素带有从 1 开始的题目编号 index。
+    """
+    questions = "\n".join(f"题目 {index}：\n{question_text}\n" for index, question_text in enumerate(question_texts, 1))
+    return (
+        f"请识别以下 {len(question_texts)} 道完整问题的详细内容，并以 JSON 数组格式输出，不要包含 ``` 标记。"
+        f"数组中每个元素对应一道题，按题目编号顺序排列，index 为题目编号。"
+        f"{PROMPT_RULES.format(choice_types=choice_types)}"
+        f"数组元素结构如下：\n"
+        f"{{'index': 1, {QUESTION_STRUCTURE}}}\n"
+        f"完整问题：\n{questions}"
+    )
+
+
+def clean_non_standard_json(content):
+    content = content.replace("'", '"')
+    content = re.sub(r'\btrue\b', 'true', content, flags=re.IGNORECASE)
+    content = re.sub(r'\bfalse\b', 'false', content, flags=re.IGNORECASE)
+    return content
+
+
+def is_json_response(content):
+    """
+    回复能解析为 JSON 时才写入缓存，避免缓存错误的识别结果。
+    """
+    try:
+        json.loads(clean_non_standard_json(content))
+        return True
+    except json.JSONDecodeError:
+        return False
+
+
+# 需要选项和答案的题型
+CHOICE_QUESTION_TYPES = ('单选题', '多选题', '判断题')
+
+
+def parse_question_reply(content):
+    """
+    解析并校验单题识别结果。
+    :param content: 模型回复文本，调用失败时为 None
+    :return: (题目字典, None)；识别失败或题目不完整时返回 (None, 原因)
+    """
+    if content is None:
+        return None, "识别接口调用失败"
+    try:
+        recognized_data = json.loads(clean_non_standard_json(content))
+    except json.JSONDecodeError:
+        return None, "识别结果解析失败"
+    if (not isinstance(recognized_data, dict) or 'question_type' not in recognized_data
+            or not isinstance(recognized_data.get('content'), str)):
+        return None, "识别结果缺少题型或题目内容"
+    # 检查题目内容是否完整
+    if recognized_data['question_type'] in CHOICE_QUESTION_TYPES:
+        answer = recognized_data.get('answer')
+        if not recognized_data.get('options') or not isinstance(answer, str) or not answer.strip():
+            return None, "题目缺少选项或答案"
+    if not recognized_data['content'].strip():
+        return None, "题目内容缺失"
+    return recognized_data, None
+
+
+class SkippedQuestions:
+    """
+    导入时因识别失败或内容不完整而跳过的题目：记录总数和前 limit 条原因，并写入日志。
+    """
+
+    def __init__(self, limit=100):
+        self.count = 0
+        self.reasons = []
+        self.limit = limit
+
+    def add(self, location, reason):
+        """
+        :param location: 题目在文件中的位置，例如 "第 3 题"、"第 12 行"
+        """
+        self.count += 1
+        if len(self.reasons) < self.limit:
+            self.reasons.append(f"{location}：{reason}")
+        logger.warning(f"Skipped question at {location}: {reason}")
+
+
+def estimate_tokens(text):
+    """
+    粗略估算 token 数：中文等非 ASCII 字符按每字一个 token，ASCII 字符按每四个一个 token。
+    """
+    non_ascii = sum(1 for char in text if ord(char) > 127)
+    return non_ascii + math.ceil((len(text) - non_ascii) / 4)
+
+
+class QuestionRecognizer:
+    """
+    并发调用 chat completions 接口识别题目：线程池限制并发数，每次调用单独超时，
+    失败时按指数退避重试，结果顺序与输入的提示词顺序一致。
+    """
+
+    def __init__(self, client=None, model=LLM_MODEL, max_workers=LLM_MAX_WORKERS,
+                 timeout=LLM_TIMEOUT, max_retries=LLM_MAX_RETRIES, backoff=1.0, cache=None,
+                 batch_tokens=LLM_BATCH_TOKENS):
+        """
+        :param cache: 识别结果缓存，默认使用 RecognitionCache，传入 False 时不使用缓存
+        :param batch_tokens: 批量识别时每个请求中题目原文的估算 token 数上限，0 表示不合并请求
+        """
+        # 重试由本类控制，关闭 SDK 自带的重试
+        self.client = client or OpenAI(api_key=LLM_API_KEY, base_url=LLM_BASE_URL, max_retries=0)
+        self.model = model
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.cache = RecognitionCache() if cache is None else cache
+        self.batch_tokens = batch_tokens
+
+    def recognize_questions(self, question_texts, build_prompt, prompt_version, accept=None, build_batch_prompt=None):
+        """
+        先查缓存，只为未命中的题目调用接口，并把新结果写入缓存。
+        :param question_texts: 题目原文列表
+        :param build_prompt: 由题目原文生成提示词的函数
+        :param prompt_version: 提示词模板版本，修改提示词时需要同时修改
+        :param accept: 可选，判断回复是否可用的函数，只有可用的回复才写入缓存
+        :param build_batch_prompt: 可选，由多道题目原文生成批量提示词的函数，要求模型返回 JSON 数组
+        :return: 与 question_texts 一一对应的模型回复文本，失败的位置为 None
+        """
+        question_texts = list(question_texts)
+        if not self.cache:
+            return self._recognize_texts(question_texts, build_prompt, accept, build_batch_prompt)
+
+        keys = [cache_key(question_text, prompt_version, self.model) for question_text in question_texts]
+        cached = self.cache.get_many(keys)
+        # 同一文件中重复的题目只请求一次
+        missing = {key: question_text for key, question_text in zip(keys, question_texts) if key not in cached}
+        contents = self._recognize_texts(list(missing.values()), build_prompt, accept, build_batch_prompt)
+        recognized = {key: content for key, content in zip(missing, contents)
+                      if content is not None and (accept is None or accept(content))}
+        self.cache.put_many(recognized)
+        logger.info(f"Recognized {len(question_texts)} questions: {sum(key in cached for key in keys)} from cache, "
+                    f"{len(missing)} via API")
+
+        results = dict(zip(missing, contents))
+        results.update(cached)
+        return [results[key] for key in keys]
+
+    def _recognize_texts(self, question_texts, build_prompt, accept, build_batch_prompt):
+        if build_batch_prompt is None or self.batch_tokens <= 0:
+            return self.recognize_all(build_prompt(question_text) for question_text in question_texts)
+        return self.recognize_batched(question_texts, build_prompt, build_batch_prompt, accept)
+
+    def recognize_batched(self, question_texts, build_prompt, build_batch_prompt, accept=None):
+        """
+        把多道题目合并到一个请求中识别，每批题目原文的估算 token 数不超过 batch_tokens。
+        回复数组中的元素逐个校验并对应回原题；失败的题目拆成更小的批次重试，
+        单独一道题时使用单题提示词。
+        :return: 与 question_texts 一一对应的单题回复文本（JSON 对象），失败的位置为 None
+        """
+        results = [None] * len(question_texts)
+        if not question_texts:
+            return results
+        pending = self._split_batches(question_texts)
+        rounds = 0
+        while pending:
+            rounds += 1
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(pending))) as executor:
+                replies = list(executor.map(
+                    lambda batch: self._recognize_batch(batch, question_texts, build_prompt, build_batch_prompt, accept),
+                    pending
+                ))
+            retry = []
+            for batch, contents in zip(pending, replies):
+                failed = []
+                for index, content in zip(batch, contents):
+                    if content is None:
+                        failed.append(index)
+                    else:
+                        results[index] = content
+                # 单题请求已经重试过，不再重试
+                if failed and len(batch) > 1:
+                    size = max(1, len(batch) // 2)
+                    retry.extend(failed[start:start + size] for start in range(0, len(failed), size))
+            pending = retry
+        logger.info(f"Batch recognition of {len(question_texts)} questions finished in {rounds} rounds")
+        return results
+
+    def _split_batches(self, question_texts):
+        """
+        按题目顺序切分批次，超出预算的单道题单独成批。
+        """
+        batches, current, tokens = [], [], 0
+        for index, question_text in enumerate(question_texts):
+            cost = estimate_tokens(question_text)
+            if current and tokens + cost > self.batch_tokens:
+                batches.append(current)
+                current, tokens = [], 0
+            current.append(index)
+            tokens += cost
+        if current:
+            batches.append(current)
+        return batches
+
+    def _recognize_batch(self, batch, question_texts, build_prompt, build_batch_prompt, accept):
+        if len(batch) == 1:
+            return [self.recognize(build_prompt(question_texts[batch[0]]))]
+
+        content = self.recognize(build_batch_prompt([question_texts[index] for index in batch]))
+        items = self._parse_batch_reply(content, len(batch)) if content is not None else None
+        if items is None:
+            return [None] * len(batch)
+        contents = []
+        for item in items:
+            if not isinstance(item, dict):
+                contents.append(None)
+                continue
+            item = {key: value for key, value in item.items() if key != 'index'}
+            item_content = json.dumps(item, ensure_ascii=False)
+            contents.append(item_content if accept is None or accept(item_content) else None)
+        return contents
+
+    def _parse_batch_reply(self, content, size):
+        """
+        解析批量回复中的 JSON 数组，返回长度为 size 的列表，缺失的题目位置为 None。
+        元素带有从 1 开始的 index 字段时按编号对应题目，否则要求元素个数与题目数相同并按顺序对应。
+        """
+        start, end = content.find('['), content.rfind(']')
+        if start == -1 or end < start:
+            logger.warning("Batch recognition reply is not a JSON array")
+            return None
+        text = content[start:end + 1]
+        try:
+            items = json.loads(text)
+        except json.JSONDecodeError:
+            # 与单题识别相同的宽松处理：单引号替换为双引号
+            try:
+                items = json.loads(re.sub(r'\b(true|false)\b', lambda m: m.group(1).lower(), text.replace("'", '"'),
+                                          flags=re.IGNORECASE))
+            except json.JSONDecodeError:
+                logger.warning("Batch recognition reply could not be parsed")
+                return None
+        if not isinstance(items, list):
+            return None
+
+        indexed = [item for item in items if isinstance(item, dict) and isinstance(item.get('index'), int)]
+        if indexed and len(indexed) == len(items):
+            mapped = [None] * size
+            for item in indexed:
+                if 1 <= item['index'] <= size and mapped[item['index'] - 1] is None:
+                    mapped[item['index'] - 1] = item
+            return mapped
+        if len(items) != size:
+            logger.warning(f"Batch recognition returned {len(items)} items for {size} questions")
+            return None
+        return items
+
+    def recognize_all(self, prompts):
+        """
+        :param prompts: 提示词列表
+        :return: 与 prompts 一一对应的模型回复文本，重试后仍失败的位置为 None
+        """
+        prompts = list(prompts)
+        if not prompts:
+            return []
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(prompts))) as executor:
+            return list(executor.map(self.recognize, prompts))
+
+    def recognize(self, prompt):
+        """
+        识别单个题目，返回模型回复文本；重试次数用尽后返回 None。
+        """
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = self.client.chat.completions.create(
+                    model=self.model,
+                    messages=[
+                        {"role": "system", "content": "You are a helpful assistant"},
+                        {"role": "user", "content": prompt},
+                    ],
+                    stream=False,
+                    timeout=self.timeout
+                )
+                return response.choices[0].message.content.strip()
+            except Exception as e:
+                if attempt == self.max_retries:
+                    logger.error(f"LLM recognition failed after {attempt + 1} attempts: {str(e)}")
+                    return None
+                delay = self.backoff * (2 ** attempt)
+                logger.warning(f"LLM recognition failed ({str(e)}), retrying in {delay:.1f}s")
+                time.sleep(delay)
@@ -0,0 +1,137 @@
+# recognition_cache.py
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+
+logger = logging.getLogger(__name__)
+
+# 识别结果缓存配置，可通过环境变量覆盖
+LLM_CACHE_DIR = os.environ.get('LLM_CACHE_DIR', './cache')
+LLM_CACHE_MAX_BYTES = int(os.environ.get('LLM_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+
+
+def normalize_question_text(question_text):
+    """
+    统一全半角并合并空白，使仅有排版差异的同一道题得到相同的缓存键。
+    """
+    text = unicodedata.normalize('NFKC', question_text)
+    return re.sub(r'\s+', ' ', text).strip()
+
+
+def cache_key(question_text, prompt_version, model):
+    """
+    缓存键由规范化后的题目文本、提示词版本和模型名称共同决定，修改提示词或更换模型后旧结果自动失效。
+    """
+    payload = '\x00'.join([prompt_version, model, normalize_question_text(question_text)])
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class RecognitionCache:
+    """
+    大模型识别结果的持久化缓存，存放在缓存目录下的 SQLite 文件中。
+    总大小超过 max_bytes 时按最近使用时间淘汰旧条目，hits/misses 记录本进程内的命中情况。
+    """
+
+    def __init__(self, cache_dir=LLM_CACHE_DIR, max_bytes=LLM_CACHE_MAX_BYTES):
+        os.makedirs(cache_dir, exist_ok=True)
+        self.path = os.path.join(cache_dir, 'recognition_cache.sqlite3')
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS recognition_cache ("
+                "key TEXT PRIMARY KEY, content TEXT NOT NULL, size INTEGER NOT NULL, last_used REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS recognition_cache_last_used ON recognition_cache (last_used)")
+
+    def get_many(self, keys):
+        """
+        :param keys: 缓存键列表
+        :return: {key: content}，只包含命中的键
+        """
+        keys = list(dict.fromkeys(keys))
+        found = {}
+        with self._lock, self._connect() as conn:
+            # SQLite 单条语句的参数个数有限，分批查询
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                placeholders = ','.join('?' * len(chunk))
+                found.update(conn.execute(
+                    f"SELECT key, content FROM recognition_cache WHERE key IN ({placeholders})", chunk
+                ).fetchall())
+            if found:
+                now = time.time()
+                conn.executemany("UPDATE recognition_cache SET last_used = ? WHERE key = ?",
+                                 [(now, key) for key in found])
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def put_many(self, items):
+        """
+        :param items: {key: content}
+        """
+        if not items:
+            return
+        now = time.time()
+        rows = [(key, content, len(content.encode('utf-8')), now) for key, content in items.items()]
+        with self._lock, self._connect() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO recognition_cache (key, content, size, last_used) VALUES (?, ?, ?, ?)", rows
+            )
+            self._evict(conn)
+
+    def stats(self):
+        with self._lock, self._connect() as conn:
+            entries, size = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM recognition_cache").fetchone()
+        return {"hits": self.hits, "misses": self.misses, "entries": entries, "bytes": size}
+
+    def clear(self):
+        with self._lock, self._connect() as conn:
+            conn.execute("DELETE FROM recognition_cache")
+
+    def _evict(self, conn):
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM recognition_cache").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # 淘汰到上限的 90%，避免每次写入都触发淘汰
+        target = total - int(self.max_bytes * 0.9)
+        evicted, freed = [], 0
+        for key, size in conn.execute("SELECT key, size FROM recognition_cache ORDER BY last_used"):
+            if freed >= target:
+                break
+            evicted.append((key,))
+            freed += size
+        conn.executemany("DELETE FROM recognition_cache WHERE key = ?", evicted)
+        logger.info(f"Evicted {len(evicted)} recognition cache entries ({freed} bytes)")
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.isolation_level = None
+        return _Transaction(conn)
+
+
+class _Transaction:
+    """
+    打开连接并开启事务，退出时提交（出错时回滚）并关闭连接。
+    """
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+        finally:
+            self.conn.close()
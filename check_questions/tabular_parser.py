@@ -0,0 +1,134 @@
+# tabular_parser.py
+import re
+import pandas as pd
+
+# 选项列字母，最多支持 A-F 六个选项
+OPTION_LETTERS = 'ABCDEF'
+
+# 表头别名，比较前去掉空白、下划线、冒号并转为小写
+COLUMN_ALIASES = {
+    'question_type': {'题型', '类型', '题目类型', '试题类型', 'type', 'questiontype'},
+    'content': {'题干', '题目', '内容', '题目内容', '试题内容', '问题', 'stem', 'content', 'question'},
+    'answer': {'答案', '正确答案', '参考答案', '标准答案', 'answer'},
+}
+OPTION_COLUMN_PATTERN = re.compile(r'^(?:选项|option)?([a-f])(?:选项)?$')
+
+# 题型别名，统一为导入时使用的题型名称
+TYPE_ALIASES = {
+    '单选': '单选题', '单选题': '单选题', '单项选择': '单选题', '单项选择题': '单选题', '选择题': '单选题',
+    '多选': '多选题', '多选题': '多选题', '多项选择': '多选题', '多项选择题': '多选题', '不定项选择题': '多选题',
+    '判断': '判断题', '判断题': '判断题',
+    '填空': '填空题', '填空题': '填空题',
+    '简答': '主观题', '简答题': '主观题', '主观题': '主观题', '问答题': '主观题', '论述题': '主观题',
+}
+TRUE_ANSWERS = {'对', '正确', '√', '是', 'T', 'TRUE', 'Y', 'YES'}
+FALSE_ANSWERS = {'错', '错误', '×', 'X', '否', 'F', 'FALSE', 'N', 'NO'}
+
+
+def map_columns(columns):
+    """
+    根据表头识别题型、题干、答案和 A-F 选项所在的列。
+    :return: {"question_type": 列名, "content": 列名, "answer": 列名, "options": {字母: 列名}}，未识别的字段不出现
+    """
+    mapping = {"options": {}}
+    for column in columns:
+        name = re.sub(r'[\s_\-:：]', '', str(column)).lower()
+        for field, aliases in COLUMN_ALIASES.items():
+            if name in aliases and field not in mapping:
+                mapping[field] = column
+                break
+        else:
+            match = OPTION_COLUMN_PATTERN.match(name)
+            if match and match.group(1).upper() not in mapping["options"]:
+                mapping["options"][match.group(1).upper()] = column
+    return mapping
+
+
+def parse_structured_sheet(data):
+    """
+    按列解析表头规范的题目表格，全程使用按列的向量化运算。
+    只有能确定题型、答案与选项一致的行才会被解析，其余行留给大模型识别。
+    :param data: pandas DataFrame
+    :return: (parsed, unparsed_index)，parsed 为 [(行索引, 题目字典)]，题目字典结构与大模型识别结果一致
+    """
+    mapping = map_columns(data.columns)
+    if 'content' not in mapping or ('answer' not in mapping and not mapping["options"]):
+        # 表头无法识别，整张表交给大模型
+        return [], data.index
+
+    empty = pd.Series('', index=data.index)
+    content = _text(data[mapping['content']])
+    answer = _text(data[mapping['answer']]) if 'answer' in mapping else empty
+    options = {letter: _text(data[column]) if column is not None else empty
+               for letter, column in ((letter, mapping["options"].get(letter)) for letter in OPTION_LETTERS)}
+
+    # 选择题答案统一为不重复的大写字母，例如 "a, c" -> "AC"
+    letters = answer.str.upper().str.replace(r'[\s,，、;；/|]', '', regex=True)
+    is_letters = letters.str.fullmatch(f'[{OPTION_LETTERS}]+')
+    present = pd.DataFrame({letter: options[letter] != '' for letter in OPTION_LETTERS})
+    option_count = present.sum(axis=1)
+    chosen = pd.DataFrame({letter: letters.str.contains(letter) & is_letters for letter in OPTION_LETTERS})
+    chosen_count = chosen.sum(axis=1)
+    # 选项必须从 A 开始连续填写，答案字母必须对应已填写的选项
+    contiguous = (present.astype(int).diff(axis=1).fillna(0) <= 0).all(axis=1)
+    answer_in_options = ~(chosen & ~present).any(axis=1)
+    choice_ok = is_letters & (option_count >= 2) & contiguous & answer_in_options
+
+    judge = answer.str.upper()
+    is_true, is_false = judge.isin(TRUE_ANSWERS), judge.isin(FALSE_ANSWERS)
+
+    if 'question_type' in mapping:
+        raw_type = _text(data[mapping['question_type']]).str.replace(r'\s', '', regex=True)
+        question_type = raw_type.map(TYPE_ALIASES)
+    else:
+        # 没有题型列时只推断能确定的题型：有选项的按答案个数区分单选多选，无选项且答案为对错的为判断题
+        question_type = pd.Series(None, index=data.index, dtype=object)
+        question_type[choice_ok & (chosen_count == 1)] = '单选题'
+        question_type[choice_ok & (chosen_count > 1)] = '多选题'
+        question_type[(option_count == 0) & (is_true | is_false)] = '判断题'
+
+    confident = (content != '') & (
+        ((question_type == '单选题') & choice_ok & (chosen_count == 1))
+        | ((question_type == '多选题') & choice_ok)
+        | ((question_type == '判断题') & (is_true | is_false))
+        | ((question_type == '填空题') & (answer != ''))
+        | (question_type == '主观题')
+    )
+
+    parsed = []
+    # 逐行组装结果前先转换为 Python 列表，避免逐个访问 pandas 元素的开销
+    rows = zip(data.index[confident].tolist(), question_type[confident].tolist(), content[confident].tolist(),
+               answer[confident].tolist(), chosen[confident].to_numpy().tolist(),
+               present[confident].to_numpy().tolist(),
+               *(options[letter][confident].tolist() for letter in OPTION_LETTERS), is_true[confident].tolist())
+    for index, row_type, row_content, row_answer, row_chosen, row_present, *row_options, row_true in rows:
+        if row_type in ('单选题', '多选题'):
+            question = {
+                "question_type": row_type,
+                "content": row_content,
+                "answer": ', '.join(letter for letter, flag in zip(OPTION_LETTERS, row_chosen) if flag),
+                "options": [{"text": text, "is_correct": bool(flag)}
+                            for text, flag, filled in zip(row_options, row_chosen, row_present) if filled],
+            }
+        elif row_type == '判断题':
+            question = {
+                "question_type": row_type,
+                "content": row_content,
+                "answer": '对' if row_true else '错',
+                "options": [{"text": '对', "is_correct": bool(row_true)}, {"text": '错', "is_correct": not row_true}],
+            }
+        else:
+            question = {"question_type": row_type, "content": row_content, "answer": row_answer, "options": []}
+        parsed.append((index, question))
+    return parsed, data.index[~confident]
+
+
+def _text(series):
+    """
+    把一列单元格转换为去掉首尾空白的字符串，空单元格为空字符串，整数值的浮点数不带小数部分。
+    """
+    text = series.astype(object).where(series.notna(), '')
+    if pd.api.types.is_float_dtype(series):
+        integral = series.notna() & (series % 1 == 0)
+        text[integral] = series[integral].astype('int64').astype(str)
+    return text.astype(str).str.strip()
@@ -0,0 +1,213 @@
+# exam_cache.py
+from bisect import bisect_right
+from collections import namedtuple
+from datetime import datetime, timedelta
+import hashlib
+import json
+import threading
+import time
+from models import ExamQuestions, Exams, QuestionOptions, Questions
+from grading import answer_key_cache
+
+# 试卷快照中的只读对象，字段与模板中使用的模型属性保持一致
+PaperExam = namedtuple('PaperExam', ['id', 'name'])
+PaperOption = namedtuple('PaperOption', ['id', 'option_text'])
+PaperQuestion = namedtuple('PaperQuestion', ['id', 'content', 'question_type', 'options'])
+
+
+class PaperSnapshot(namedtuple('PaperSnapshot', ['exam', 'questions', 'version', 'option_questions'])):
+    """
+    option_questions 为选项ID到所属题目ID的索引，用于在不查询数据库的情况下校验提交的选项。
+    """
+    __slots__ = ()
+
+    def resolve_option(self, question_id, value):
+        """
+        校验提交的选项属于该题目，返回整数选项ID；选项无效或属于其他题目时返回 None。
+        """
+        try:
+            option_id = int(value)
+        except (TypeError, ValueError):
+            return None
+        if self.option_questions.get(option_id) != question_id:
+            return None
+        return option_id
+
+
+def load_paper(exam_id):
+    """
+    用两条查询构建考试的试卷快照，考试不存在时返回 None。
+    """
+    exam = Exams.select(Exams.id, Exams.name).where(Exams.id == exam_id).tuples().first()
+    if not exam:
+        return None
+
+    exam_questions = list(ExamQuestions
+                          .select(Questions.id, Questions.content, Questions.question_type)
+                          .join(Questions)
+                          .where(ExamQuestions.exam == exam_id)
+                          .order_by(ExamQuestions.id)
+                          .tuples())
+    options = {}
+    question_ids = list({question_id for question_id, _, _ in exam_questions})
+    if question_ids:
+        query = (QuestionOptions
+                 .select(QuestionOptions.id, QuestionOptions.question, QuestionOptions.option_text)
+                 .where(QuestionOptions.question.in_(question_ids))
+                 .order_by(QuestionOptions.id)
+                 .tuples())
+        for option_id, question_id, option_text in query:
+            options.setdefault(question_id, []).append(PaperOption(option_id, option_text))
+
+    questions = tuple(
+        PaperQuestion(question_id, content, question_type, tuple(options.get(question_id, ())))
+        for question_id, content, question_type in exam_questions
+    )
+    # 版本号由试卷内容计算，内容不变时版本号不变，多进程间也保持一致
+    digest = hashlib.sha1(json.dumps([exam, questions], ensure_ascii=False).encode('utf-8')).hexdigest()[:16]
+    option_questions = {option.id: question.id for question in questions for option in question.options}
+    return PaperSnapshot(PaperExam(*exam), questions, digest, option_questions)
+
+
+class PaperCache:
+    """
+    进程内的试卷快照缓存：同一考试的所有学生共享一份不可变快照，
+    并发未命中时只有一个线程从数据库加载。
+    max_age 为快照的最长缓存时间，使多进程部署下其他进程修改的试卷也能生效。
+    """
+
+    def __init__(self, max_age=60):
+        self.max_age = max_age
+        # {exam_id: (快照, 加载时间)}
+        self._papers = {}
+        self._generation = 0
+        self._lock = threading.Lock()
+        # {exam_id: [加载锁, 正在使用该锁的线程数]}，没有线程使用时删除，客户端请求不存在的考试不会使其增长
+        self._build_locks = {}
+
+    def get(self, exam_id):
+        paper = self._fresh(exam_id)
+        if paper is not None:
+            return paper
+
+        with self._lock:
+            build_lock = self._build_locks.get(exam_id)
+            if build_lock is None:
+                build_lock = self._build_locks[exam_id] = [threading.Lock(), 0]
+            build_lock[1] += 1
+        try:
+            with build_lock[0]:
+                # 等待期间其他线程可能已经加载完成
+                paper = self._fresh(exam_id)
+                if paper is not None:
+                    return paper
+                generation = self._generation
+                loaded_at = time.monotonic()
+                paper = load_paper(exam_id)
+                with self._lock:
+                    # 加载期间若发生失效，则不写入可能已过期的快照
+                    if paper is not None and generation == self._generation:
+                        self._papers[exam_id] = (paper, loaded_at)
+            return paper
+        finally:
+            with self._lock:
+                build_lock[1] -= 1
+                if not build_lock[1]:
+                    del self._build_locks[exam_id]
+
+    def invalidate(self, exam_id=None):
+        with self._lock:
+            self._generation += 1
+            if exam_id is None:
+                self._papers.clear()
+            else:
+                self._papers.pop(exam_id, None)
+
+    def _fresh(self, exam_id):
+        entry = self._papers.get(exam_id)
+        if entry is not None and time.monotonic() - entry[1] < self.max_age:
+            return entry[0]
+        return None
+
+
+paper_cache = PaperCache()
+
+
+class ExamSchedule:
+    """
+    未结束考试的内存时间表，按开始时间排序。
+    正在进行的考试列表在下一个开始或结束时间点之前直接复用，到达时间点时只在内存中重新计算；
+    只有考试被创建、修改、删除时才重新从数据库加载。
+    max_age 为兜底的重新加载间隔，使多进程部署下其他进程的修改也能生效。
+    """
+
+    def __init__(self, max_age=60):
+        self.max_age = timedelta(seconds=max_age)
+        self._exams = None
+        self._starts = []
+        self._loaded_at = None
+        self._active = None
+        self._next_start = None
+        self._first_end = None
+        self._version = None
+        self._lock = threading.Lock()
+
+    def active_exams(self, now=None):
+        """
+        返回 start_time <= now <= end_time 的考试列表。
+        """
+        return self.snapshot(now)[0]
+
+    def snapshot(self, now=None):
+        """
+        返回 (正在进行的考试列表, 版本号)，列表内容不变时版本号不变，可用作 ETag。
+        """
+        now = now or datetime.now()
+        with self._lock:
+            if self._exams is None or now - self._loaded_at >= self.max_age or now < self._loaded_at:
+                self._load(now)
+            if self._active is None or not (now < self._next_start and now <= self._first_end):
+                self._compute(now)
+            return list(self._active), self._version
+
+    def invalidate(self):
+        with self._lock:
+            self._exams = None
+            self._active = None
+
+    def _load(self, now):
+        query = (Exams
+                 .select(Exams.id, Exams.name, Exams.start_time, Exams.end_time)
+                 .where(Exams.end_time >= now)
+                 .order_by(Exams.start_time, Exams.id))
+        self._exams = [{"id": exam.id, "name": exam.name, "start_time": exam.start_time, "end_time": exam.end_time}
+                       for exam in query]
+        self._starts = [exam["start_time"] for exam in self._exams]
+        self._loaded_at = now
+        self._active = None
+
+    def _compute(self, now):
+        started = bisect_right(self._starts, now)
+        # 已结束的考试不会再次开始，直接从时间表中移除
+        self._exams = [exam for exam in self._exams[:started] if exam["end_time"] >= now] + self._exams[started:]
+        self._starts = [exam["start_time"] for exam in self._exams]
+        started = bisect_right(self._starts, now)
+        self._active = sorted(self._exams[:started], key=lambda exam: exam["id"])
+        self._next_start = self._starts[started] if started < len(self._starts) else datetime.max
+        self._first_end = min((exam["end_time"] for exam in self._active), default=datetime.max)
+        payload = json.dumps(self._active, ensure_ascii=False, default=str)
+        self._version = hashlib.sha1(payload.encode('utf-8')).hexdigest()[:16]
+
+
+exam_schedule = ExamSchedule()
+
+
+def invalidate_exam_caches(exam_id=None):
+    """
+    考试、试题、题目或选项发生变化时调用，使试卷快照、答案缓存和考试时间表失效。
+    不指定考试时清空全部（修改题目时无法确定影响了哪些考试）。
+    """
+    paper_cache.invalidate(exam_id)
+    answer_key_cache.invalidate(exam_id)
+    # 考试名称、时间或删除都会改变考试时间表，删除题库也会级联删除考试
+    exam_schedule.invalidate()
@@ -0,0 +1,23 @@
+# file_lock.py
+try:
+    import fcntl
+except ImportError:
+    # Windows 没有 fcntl，无法加锁
+    fcntl = None
+
+
+def try_lock(path):
+    """
+    对锁文件加非阻塞排他锁，进程退出时由操作系统自动释放。
+    :return: 成功时返回锁文件对象（关闭即释放），已被其他进程锁定时返回 None；
+             没有 fcntl 的平台（Windows）不加锁，总是返回锁文件对象
+    """
+    lock = open(path, 'a')
+    if fcntl is None:
+        return lock
+    try:
+        fcntl.flock(lock.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock.close()
+        return None
+    return lock
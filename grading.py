@@ -0,0 +1,163 @@
+# grading.py
+from collections import defaultdict
+import threading
+import time
+from peewee import fn
+from models import db, ExamQuestions, QuestionOptions, Questions, StudentAnswers, StudentGrades
+
+# 可自动批改的客观题类型
+OBJECTIVE_TYPES = ['单选题', '多选题', '判断题']
+
+# 每条批量 UPDATE 语句中 IN 列表的最大长度
+UPDATE_CHUNK_SIZE = 1000
+
+
+def load_answer_key(exam_id):
+    """
+    一次性加载整场考试客观题的标准答案。
+    :return: {question_id: {"question_type": 题型, "score": 分值, "correct_option_ids": 正确选项ID字符串列表}}
+    """
+    answer_key = {}
+    exam_questions = (ExamQuestions
+                      .select(ExamQuestions.question, ExamQuestions.score, Questions.question_type)
+                      .join(Questions)
+                      .where(ExamQuestions.exam == exam_id, Questions.question_type.in_(OBJECTIVE_TYPES))
+                      .order_by(ExamQuestions.id)
+                      .tuples())
+    for question_id, score, question_type in exam_questions:
+        # 同一题目重复出现时以最后一条为准，与逐题批改时的覆盖顺序一致
+        answer_key[question_id] = {"question_type": question_type, "score": score, "correct_option_ids": []}
+
+    if answer_key:
+        correct_options = (QuestionOptions
+                           .select(QuestionOptions.id, QuestionOptions.question)
+                           .where(QuestionOptions.question.in_(list(answer_key)), QuestionOptions.is_correct == True)
+                           .order_by(QuestionOptions.id)
+                           .tuples())
+        for option_id, question_id in correct_options:
+            answer_key[question_id]["correct_option_ids"].append(str(option_id))
+    return answer_key
+
+
+class AnswerKeyCache:
+    """
+    按考试缓存客观题答案，供交卷时即时批改使用；试题、选项或分值变化时需调用 invalidate。
+    max_age 为答案的最长缓存时间，使多进程部署下其他进程修改的答案也能生效。
+    """
+
+    def __init__(self, max_age=60):
+        self.max_age = max_age
+        # {exam_id: (答案, 加载时间)}
+        self._keys = {}
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def get(self, exam_id):
+        entry = self._keys.get(exam_id)
+        if entry is not None and time.monotonic() - entry[1] < self.max_age:
+            return entry[0]
+        generation = self._generation
+        loaded_at = time.monotonic()
+        answer_key = load_answer_key(exam_id)
+        with self._lock:
+            # 加载期间若发生失效，则不写入可能已过期的答案
+            if generation == self._generation:
+                self._keys[exam_id] = (answer_key, loaded_at)
+        return answer_key
+
+    def invalidate(self, exam_id=None):
+        """
+        使指定考试的答案失效；不指定考试时清空全部（题目被修改时无法确定影响了哪些考试）。
+        """
+        with self._lock:
+            self._generation += 1
+            if exam_id is None:
+                self._keys.clear()
+            else:
+                self._keys.pop(exam_id, None)
+
+
+answer_key_cache = AnswerKeyCache()
+
+
+def score_answer(key, selected_option_id, answer_text):
+    """
+    按题型规则计算单个答案的得分，返回写入 reserved1 的字符串。
+    """
+    if key["question_type"] == '多选题':
+        student_option_ids = answer_text.split(',') if answer_text else []
+        if set(student_option_ids) == set(key["correct_option_ids"]):
+            return str(key["score"])
+        return '0'
+    # 单选题和判断题
+    if selected_option_id and str(selected_option_id) in key["correct_option_ids"]:
+        return str(key["score"])
+    return '0'
+
+
+class GradingEngine:
+    """
+    基于集合运算的客观题批改：加载一次答案，在内存中打分，再按分值分组批量写回。
+    """
+
+    def __init__(self, chunk_size=UPDATE_CHUNK_SIZE):
+        self.chunk_size = chunk_size
+
+    def grade_exam(self, exam_id):
+        """
+        批改一场考试的全部客观题答案，返回得分发生变化的答案数量。
+        """
+        answer_key = load_answer_key(exam_id)
+        if not answer_key:
+            return 0
+
+        student_answers = (StudentAnswers
+                           .select(StudentAnswers.id, StudentAnswers.question, StudentAnswers.selected_option,
+                                   StudentAnswers.answer_text, StudentAnswers.reserved1)
+                           .where(StudentAnswers.exam == exam_id, StudentAnswers.question.in_(list(answer_key)))
+                           .tuples())
+
+        # 按新得分分组，只回写得分有变化的答案
+        ids_by_score = defaultdict(list)
+        for answer_id, question_id, selected_option_id, answer_text, current_score in student_answers:
+            new_score = score_answer(answer_key[question_id], selected_option_id, answer_text)
+            if new_score != current_score:
+                ids_by_score[new_score].append(answer_id)
+
+        changed = 0
+        with db.atomic():
+            for new_score, answer_ids in ids_by_score.items():
+                for start in range(0, len(answer_ids), self.chunk_size):
+                    chunk = answer_ids[start:start + self.chunk_size]
+                    StudentAnswers.update(reserved1=new_score).where(StudentAnswers.id.in_(chunk)).execute()
+                    changed += len(chunk)
+        return changed
+
+
+def compute_total_grades(exam_id, student_ids=None):
+    """
+    用一条 GROUP BY 聚合查询计算学生在某场考试中的总分。
+    :param student_ids: 可选，只计算指定学生（Students 主键）的总分
+    :return: {student_pk: total}
+    """
+    total = fn.COALESCE(fn.SUM(StudentAnswers.reserved1.cast('DECIMAL(10, 2)')), 0)
+    query = (StudentAnswers
+             .select(StudentAnswers.student, total)
+             .where(StudentAnswers.exam == exam_id))
+    if student_ids is not None:
+        query = query.where(StudentAnswers.student.in_(list(student_ids)))
+    return {student_id: total for student_id, total in query.group_by(StudentAnswers.student).tuples()}
+
+
+def save_total_grades(exam_id, totals):
+    """
+    用一条多行 INSERT ... ON DUPLICATE KEY UPDATE 写入总分，依赖 (student_id, exam_id) 唯一键。
+    """
+    if not totals:
+        return 0
+    rows = [(student_id, exam_id, int(total)) for student_id, total in totals.items()]
+    return (StudentGrades
+            .insert_many(rows, fields=[StudentGrades.student, StudentGrades.exam, StudentGrades.grade])
+            .on_conflict(preserve=[StudentGrades.grade])
+            .execute())
+
@@ -0,0 +1,130 @@
+# import_jobs.py
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+import logging
+import os
+import threading
+import uuid
+from models import db
+
+logger = logging.getLogger(__name__)
+
+
+class ImportJob:
+    """
+    一次题库导入任务的状态。status 依次为 queued、parsing、importing，最后为 done 或 failed。
+    failed 为未能导入的题目数（写入失败和识别失败），errors 为对应的原因，任务为 done 时也可能不为空。
+    """
+
+    def __init__(self, question_bank_id, filename):
+        self.id = uuid.uuid4().hex
+        self.question_bank_id = question_bank_id
+        self.filename = filename
+        self.status = 'queued'
+        self.processed = 0
+        self.total = 0
+        self.failed = 0
+        self.errors = []
+        self.result = None
+        self.created_at = datetime.now()
+        self.finished_at = None
+
+    def to_dict(self):
+        return {
+            "job_id": self.id,
+            "question_bank_id": self.question_bank_id,
+            "filename": self.filename,
+            "status": self.status,
+            "processed": self.processed,
+            "total": self.total,
+            "failed": self.failed,
+            "errors": list(self.errors),
+            "result": self.result,
+            "created_at": self.created_at.strftime('%Y-%m-%d %H:%M:%S'),
+            "finished_at": self.finished_at.strftime('%Y-%m-%d %H:%M:%S') if self.finished_at else None,
+        }
+
+
+class ImportJobRunner:
+    """
+    本地后台导入：上传的文件交给线程池处理，请求立即返回任务ID，通过 status 查询进度。
+    任务结束后由任务自身删除临时文件；已结束的任务保留 ttl 秒供查询。
+    """
+
+    def __init__(self, import_fn, max_workers=2, ttl=3600, all_or_nothing=False):
+        """
+        :param import_fn: 导入函数，签名为 import_fn(file_path, question_bank_id, all_or_nothing=..., progress=回调)，
+                          回调参数为 (阶段, 已处理数, 总数)，返回 {"status": ..., "message": ...}，
+                          可选的 failed、skipped 和 errors 计入任务的 failed 和 errors
+        :param all_or_nothing: 传给 import_fn，默认每批单独提交，题目陆续可见
+        """
+        self.import_fn = import_fn
+        self.all_or_nothing = all_or_nothing
+        self.ttl = timedelta(seconds=ttl)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='import-job')
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def submit(self, file_path, question_bank_id, filename=None):
+        """
+        提交导入任务，返回任务ID。file_path 指向的临时文件由任务负责删除。
+        """
+        job = ImportJob(question_bank_id, filename or os.path.basename(file_path))
+        with self._lock:
+            self._purge()
+            self._jobs[job.id] = job
+        self._executor.submit(self._run, job, file_path)
+        logger.info(f"Import job {job.id} queued for question bank {question_bank_id}: {job.filename}")
+        return job.id
+
+    def status(self, job_id):
+        """
+        :return: 任务状态字典，任务不存在或已过期时返回 None
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return job.to_dict() if job else None
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
+
+    def _run(self, job, file_path):
+        def progress(stage, processed, total):
+            with self._lock:
+                job.status, job.processed, job.total = stage, processed, total
+
+        try:
+            progress('parsing', 0, 0)
+            # 后台线程不经过请求钩子，import_fn 只在写入时占用连接，结束后确保连接已归还连接池
+            try:
+                result = self.import_fn(file_path, job.question_bank_id, all_or_nothing=self.all_or_nothing,
+                                        progress=progress)
+            finally:
+                if not db.is_closed():
+                    db.close()
+            with self._lock:
+                job.result = result
+                job.failed = result.get("failed", 0) + result.get("skipped", 0)
+                job.errors.extend(result.get("errors", []))
+                if result.get("status") == "success":
+                    job.status = 'done'
+                else:
+                    job.status = 'failed'
+                    job.errors.insert(0, result.get("message"))
+        except Exception as e:
+            logger.error(f"Import job {job.id} failed: {str(e)}")
+            with self._lock:
+                job.status = 'failed'
+                job.errors.append(str(e))
+        finally:
+            with self._lock:
+                job.finished_at = datetime.now()
+            if os.path.exists(file_path):
+                os.remove(file_path)
+        logger.info(f"Import job {job.id} finished with status {job.status}, {job.failed} questions not imported")
+
+    def _purge(self):
+        expired_before = datetime.now() - self.ttl
+        for job_id in [job_id for job_id, job in self._jobs.items()
+                       if job.finished_at and job.finished_at < expired_before]:
+            del self._jobs[job_id]
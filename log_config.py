@@ -0,0 +1,106 @@
+# log_config.py
+from datetime import datetime, timedelta
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+
+# 与原有日志配置一致的文本格式，log_reader.py 按此格式解析日志
+LOG_FORMAT = '%(asctime)s %(levelname)s: %(message)s'
+
+
+class DailyFileHandler(logging.FileHandler):
+    """
+    按日期写入 <log_dir>/<YYYYMMDD><suffix>，过了午夜自动切换到新一天的文件。
+    只由 QueueListener 的单个线程调用，切换文件无需额外加锁。
+    """
+
+    def __init__(self, log_dir, suffix='.log', encoding='utf-8'):
+        self.log_dir = log_dir
+        self.suffix = suffix
+        os.makedirs(log_dir, exist_ok=True)
+        self._next_rollover = None
+        super().__init__(self._current_path(), encoding=encoding, delay=True)
+
+    def emit(self, record):
+        if record.created >= self._next_rollover:
+            self.close()
+            self.baseFilename = self._current_path(record.created)
+        super().emit(record)
+
+    def _current_path(self, timestamp=None):
+        now = datetime.fromtimestamp(timestamp) if timestamp else datetime.now()
+        midnight = datetime.combine(now.date() + timedelta(days=1), datetime.min.time())
+        self._next_rollover = midnight.timestamp()
+        return os.path.abspath(os.path.join(self.log_dir, f"{now.strftime('%Y%m%d')}{self.suffix}"))
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """
+    每条日志输出为一行 JSON，便于后续按字段解析。
+    """
+
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            "level": record.levelname,
+            "logger": record.name,
+            "thread": record.threadName,
+            "message": record.getMessage(),
+        }
+        return json.dumps(entry, ensure_ascii=False)
+
+
+_listener = None
+_queue_handler = None
+_lock = threading.Lock()
+
+
+def setup_logging(log_dir='./logs', level=logging.INFO, json_lines=False):
+    """
+    配置根日志：请求线程只把日志放入队列，由单独的监听线程写入当天的日志文件。
+    :param json_lines: 为 True 时同时写入 <YYYYMMDD>.jsonl，每行一条 JSON
+    重复调用时不会重复配置。
+    """
+    global _listener, _queue_handler
+    with _lock:
+        if _listener is not None:
+            return _listener
+
+        text_handler = DailyFileHandler(log_dir, '.log')
+        text_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+        handlers = [text_handler]
+        if json_lines:
+            json_handler = DailyFileHandler(log_dir, '.jsonl')
+            json_handler.setFormatter(JsonLinesFormatter())
+            handlers.append(json_handler)
+
+        log_queue = queue.SimpleQueue()
+        _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+        _listener.start()
+        # 进程退出时写完队列中剩余的日志
+        atexit.register(shutdown_logging)
+
+        _queue_handler = logging.handlers.QueueHandler(log_queue)
+        root = logging.getLogger()
+        root.addHandler(_queue_handler)
+        root.setLevel(level)
+        return _listener
+
+
+def shutdown_logging():
+    """
+    写完队列中剩余的日志并停止监听线程，可重复调用。
+    """
+    global _listener, _queue_handler
+    with _lock:
+        if _listener is None:
+            return
+        logging.getLogger().removeHandler(_queue_handler)
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener, _queue_handler = None, None
@@ -0,0 +1,312 @@
+# log_index.py
+from contextlib import closing
+import logging
+import os
+import re
+import sqlite3
+import threading
+from file_lock import try_lock
+from log_reader import LOG_DIR, LOG_FILE_PATTERN, RECORD_HEADER
+
+logger = logging.getLogger(__name__)
+
+# 索引文件位置，可通过环境变量覆盖
+LOG_INDEX_PATH = os.environ.get('LOG_INDEX_PATH', os.path.join(LOG_DIR, 'log_index.sqlite3'))
+
+# 从日志内容中提取的检索词：操作人、考试、题库，以及访问日志中的路由和状态码。
+# 日志中的操作人写作 "student 12"（Students 主键）、"teacher 'T001'"、"admin 'root'"：
+# 只接受引号中的标识或含数字的标识，"Student logged out" 这类普通文字不会被当作操作人
+ACTOR_PATTERN = re.compile(r"\b(student|teacher|admin)\s+(?:'([^'\s]+)'|((?=[\w-]*\d)[\w-]+))", re.IGNORECASE)
+EXAM_PATTERN = re.compile(r"\bexam(?:\s+ID)?\s+'?(\d+)'?", re.IGNORECASE)
+BANK_PATTERN = re.compile(r"\bquestion bank\s+(\d+)", re.IGNORECASE)
+ACCESS_PATTERN = re.compile(r'"(?:\x1b\[[\d;]*m)?([A-Z]+) (\S+) HTTP/[\d.]+(?:\x1b\[0m)?" (\d{3})')
+# 路由中跟在考试、题库路径后的数字ID
+ROUTE_EXAM_PATTERN = re.compile(r'/\w*exam\w*/(\d+)')
+ROUTE_BANK_PATTERN = re.compile(r'/question_bank/(\d+)')
+
+SEARCH_FIELDS = ('student', 'teacher', 'admin', 'exam', 'bank', 'route', 'status')
+
+
+def normalize_route(path):
+    """
+    去掉查询参数，并把路径中的数字段替换为 <id>，使同一路由的不同请求使用同一个检索词。
+    """
+    path = path.split('?', 1)[0]
+    return '/'.join('<id>' if segment.isdigit() else segment for segment in path.split('/'))
+
+
+def actor_terms(text):
+    """
+    :return: 文本中操作人的检索词，形如 "student:12"、"teacher:T001"
+    """
+    return {f'{role.lower()}:{quoted or actor_id}' for role, quoted, actor_id in ACTOR_PATTERN.findall(text)}
+
+
+def extract_terms(message):
+    """
+    :return: 检索词集合，形如 "student:12"、"exam:12"、"route:/student/exam/<id>"
+    """
+    terms = set()
+    access = ACCESS_PATTERN.search(message)
+    if access:
+        method, path, status = access.groups()
+        terms.add(f'route:{normalize_route(path)}')
+        terms.add(f'status:{status}')
+        terms.update(f'exam:{exam_id}' for exam_id in ROUTE_EXAM_PATTERN.findall(path))
+        terms.update(f'bank:{bank_id}' for bank_id in ROUTE_BANK_PATTERN.findall(path))
+        # 访问日志的操作人写在状态码之后
+        terms.update(actor_terms(message[access.end():]))
+        return terms
+    terms.update(actor_terms(message))
+    terms.update(f'exam:{exam_id}' for exam_id in EXAM_PATTERN.findall(message))
+    terms.update(f'bank:{bank_id}' for bank_id in BANK_PATTERN.findall(message))
+    return terms
+
+
+class LogIndex:
+    """
+    日志的增量倒排索引，存放在 SQLite 文件中。
+    records 表记录每条日志所在的文件日期、字节偏移、小时时间桶和级别；postings 表为 (检索词ID, 日志ID)。
+    每个日志文件记录已索引到的位置，update 只处理新追加的完整行。
+    """
+
+    def __init__(self, log_dir=LOG_DIR, path=LOG_INDEX_PATH, block_size=1024 * 1024):
+        self.log_dir = log_dir
+        self.path = path
+        self.block_size = block_size
+        self._update_lock = threading.Lock()
+        self._term_ids = {}
+        self._stopped = threading.Event()
+        with closing(self._connect()) as conn:
+            conn.executescript(
+                "CREATE TABLE IF NOT EXISTS files (date TEXT PRIMARY KEY, position INTEGER NOT NULL);"
+                "CREATE TABLE IF NOT EXISTS terms (id INTEGER PRIMARY KEY, term TEXT NOT NULL UNIQUE, "
+                "count INTEGER NOT NULL DEFAULT 0);"
+                "CREATE TABLE IF NOT EXISTS records (id INTEGER PRIMARY KEY, date TEXT NOT NULL, "
+                "offset INTEGER NOT NULL, bucket INTEGER NOT NULL, level TEXT);"
+                "CREATE INDEX IF NOT EXISTS records_bucket ON records (bucket);"
+                "CREATE INDEX IF NOT EXISTS records_date ON records (date);"
+                "CREATE TABLE IF NOT EXISTS postings (term_id INTEGER NOT NULL, record_id INTEGER NOT NULL, "
+                "PRIMARY KEY (term_id, record_id)) WITHOUT ROWID;"
+            )
+
+    def update(self):
+        """
+        索引所有日志文件中新追加的内容，返回新索引的日志条数。
+        每块日志在一个 BEGIN IMMEDIATE 事务中处理：先取得写锁再读取已索引位置和日志ID，
+        多个进程同时更新同一索引文件时依次执行，不会重复索引或分配相同的ID。
+        """
+        if not self._update_lock.acquire(blocking=False):
+            # 本进程的其他线程正在更新
+            return 0
+        try:
+            if not os.path.isdir(self.log_dir):
+                return 0
+            dates = sorted(match.group(1) for match in map(LOG_FILE_PATTERN.match, os.listdir(self.log_dir)) if match)
+            indexed = 0
+            with closing(self._connect()) as conn:
+                # 手动控制事务
+                conn.isolation_level = None
+                for date in dates:
+                    while True:
+                        count = self._index_next_block(conn, date)
+                        if count is None:
+                            break
+                        indexed += count
+            return indexed
+        finally:
+            self._update_lock.release()
+
+    def search(self, terms=None, level=None, start=None, end=None, limit=100):
+        """
+        :param terms: {字段: 值}，字段见 SEARCH_FIELDS，多个条件同时满足
+        :param level: 日志级别
+        :param start: 起始时间（datetime，按小时对齐）
+        :param end: 结束时间（datetime，包含该小时）
+        :return: 最新的 limit 条日志 [{"date", "offset", "level", "text"}]，由新到旧
+        """
+        term_values = list({self._term(field, value) for field, value in (terms or {}).items() if value})
+        conditions, params = [], []
+        if level:
+            conditions.append("r.level = ?")
+            params.append(level)
+        if start:
+            conditions.append("r.bucket >= ?")
+            params.append(int(start.strftime('%Y%m%d%H')))
+        if end:
+            conditions.append("r.bucket <= ?")
+            params.append(int(end.strftime('%Y%m%d%H')))
+
+        with closing(self._connect()) as conn:
+            found = conn.execute(
+                f"SELECT id, count FROM terms WHERE term IN ({','.join('?' * len(term_values))}) ORDER BY count",
+                term_values
+            ).fetchall() if term_values else []
+            if len(found) < len(term_values):
+                return []
+            term_ids = [term_id for term_id, _ in found]
+            driver, order = "records r", "r.id"
+            if term_ids and not self._time_range_smaller(conn, start, end, found[0][1]):
+                # 从最少的检索词的倒排列表出发，其余检索词逐条用主键检查
+                driver, order = "postings p JOIN records r ON r.id = p.record_id", "p.record_id"
+                conditions.insert(0, "p.term_id = ?")
+                params.insert(0, term_ids.pop(0))
+            for term_id in term_ids:
+                conditions.append("EXISTS (SELECT 1 FROM postings WHERE term_id = ? AND record_id = r.id)")
+                params.append(term_id)
+            where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+            # 日志ID按索引顺序递增，即按时间先后递增；按驱动表的主键排序可避免对全部命中结果排序
+            hits = conn.execute(
+                f"SELECT r.date, r.offset, r.level FROM {driver} {where} ORDER BY {order} DESC LIMIT ?",
+                params + [limit]
+            ).fetchall()
+
+        # 同一天的日志只打开一次文件
+        texts = {}
+        for date in {date for date, _, _ in hits}:
+            path = os.path.join(self.log_dir, f'{date}.log')
+            if not os.path.isfile(path):
+                continue
+            with open(path, 'rb') as f:
+                for hit_date, offset, _ in hits:
+                    if hit_date == date:
+                        texts[(date, offset)] = self._read_record(f, offset)
+        return [{"date": date, "offset": offset, "level": hit_level, "text": texts.get((date, offset), '')}
+                for date, offset, hit_level in hits]
+
+    def _time_range_smaller(self, conn, start, end, term_count):
+        """
+        判断时间范围内的日志是否少于最少检索词的日志数，是则从时间范围出发检索。计数最多数到 term_count 条。
+        """
+        if not start and not end:
+            return False
+        low = int(start.strftime('%Y%m%d%H')) if start else 0
+        high = int(end.strftime('%Y%m%d%H')) if end else 9999999999
+        in_range = conn.execute(
+            "SELECT COUNT(*) FROM (SELECT 1 FROM records WHERE bucket BETWEEN ? AND ? LIMIT ?)", (low, high, term_count)
+        ).fetchone()[0]
+        return in_range < term_count
+
+    def start(self, interval=60):
+        """
+        启动后台线程，每隔 interval 秒索引新追加的日志。
+        多个进程共用同一索引文件时，只有持有索引锁文件的进程执行后台索引，该进程退出后由其他进程接替。
+        Windows 上无法加锁，多个进程都会执行后台索引，由 BEGIN IMMEDIATE 保证结果正确。
+        """
+        def run():
+            lock = None
+            try:
+                while not self._stopped.wait(interval):
+                    if lock is None:
+                        lock = try_lock(f'{self.path}.lock')
+                        if lock is None:
+                            continue
+                    try:
+                        self.update()
+                    except Exception as e:
+                        logger.error(f"Error updating log index: {str(e)}")
+            finally:
+                if lock is not None:
+                    lock.close()
+        threading.Thread(target=run, name='log-index', daemon=True).start()
+
+    def stop(self):
+        self._stopped.set()
+
+    def _index_next_block(self, conn, date):
+        """
+        在一个写事务中索引日志文件中下一块完整的行，返回索引的日志条数；没有新的完整行时返回 None。
+        """
+        path = os.path.join(self.log_dir, f'{date}.log')
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT position FROM files WHERE date = ?", (date,)).fetchone()
+            position = row[0] if row else 0
+            size = os.path.getsize(path)
+            if size < position:
+                # 文件被截断或替换，重新索引
+                logger.warning(f"Log file {date}.log shrank, rebuilding its index")
+                conn.execute("DELETE FROM postings WHERE record_id IN (SELECT id FROM records WHERE date = ?)", (date,))
+                conn.execute("DELETE FROM records WHERE date = ?", (date,))
+                conn.execute("UPDATE terms SET count = (SELECT COUNT(*) FROM postings WHERE term_id = terms.id)")
+                conn.execute("INSERT OR REPLACE INTO files (date, position) VALUES (?, 0)", (date,))
+                position = 0
+
+            indexed = None
+            if position < size:
+                with open(path, 'rb') as f:
+                    f.seek(position)
+                    block = f.read(min(self.block_size, size - position))
+                # 只处理完整的行，最后一行可能还在写入
+                complete = block.rfind(b'\n') + 1
+                if complete == 0 and len(block) >= self.block_size:
+                    complete = len(block)
+                if complete:
+                    indexed = self._index_block(conn, date, position, block[:complete])
+                    conn.execute("INSERT OR REPLACE INTO files (date, position) VALUES (?, ?)",
+                                 (date, position + complete))
+            conn.execute("COMMIT")
+            return indexed
+        except BaseException:
+            conn.execute("ROLLBACK")
+            # 回滚后新插入的检索词ID不再有效
+            self._term_ids.clear()
+            raise
+
+    def _index_block(self, conn, date, position, block):
+        records, postings = [], []
+        offset = position
+        next_id = (conn.execute("SELECT COALESCE(MAX(id), 0) FROM records").fetchone()[0]) + 1
+        for line in block.split(b'\n')[:-1]:
+            text = line.decode('utf-8', errors='replace')
+            match = RECORD_HEADER.match(text)
+            if match:
+                record_id = next_id + len(records)
+                bucket = int(text[:13].replace('-', '').replace(' ', ''))
+                records.append((record_id, date, offset, bucket, match.group(1)))
+                for term in extract_terms(text[match.end():]):
+                    postings.append((self._term_id(conn, term), record_id))
+            offset += len(line) + 1
+        conn.executemany("INSERT INTO records (id, date, offset, bucket, level) VALUES (?, ?, ?, ?, ?)", records)
+        conn.executemany("INSERT INTO postings (term_id, record_id) VALUES (?, ?)", postings)
+        counts = {}
+        for term_id, _ in postings:
+            counts[term_id] = counts.get(term_id, 0) + 1
+        conn.executemany("UPDATE terms SET count = count + ? WHERE id = ?",
+                         [(count, term_id) for term_id, count in counts.items()])
+        return len(records)
+
+    def _term_id(self, conn, term):
+        """
+        检索词只增不删，已知的ID缓存在内存中；其他进程可能已插入同一检索词，因此用 INSERT OR IGNORE 后再查询。
+        """
+        term_id = self._term_ids.get(term)
+        if term_id is None:
+            conn.execute("INSERT OR IGNORE INTO terms (term) VALUES (?)", (term,))
+            term_id = self._term_ids[term] = conn.execute("SELECT id FROM terms WHERE term = ?", (term,)).fetchone()[0]
+        return term_id
+
+    def _read_record(self, f, offset, max_bytes=64 * 1024):
+        """
+        从偏移处读取一条日志，包含其后的续行。
+        """
+        f.seek(offset)
+        lines = f.read(max_bytes).split(b'\n')
+        record = [lines[0].decode('utf-8', errors='replace')]
+        for line in lines[1:-1]:
+            text = line.decode('utf-8', errors='replace')
+            if RECORD_HEADER.match(text):
+                break
+            record.append(text)
+        return '\n'.join(record).rstrip('\r\n')
+
+    def _term(self, field, value):
+        if field == 'route':
+            value = normalize_route(value)
+        return f'{field}:{value}'
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        # WAL 模式下检索不会被正在进行的索引更新阻塞
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
@@ -0,0 +1,137 @@
+# log_reader.py
+from collections import OrderedDict, namedtuple
+import os
+import re
+import threading
+
+# 日志目录及文件命名与 methods.py 中的日志配置一致：logs/YYYYMMDD.log
+LOG_DIR = './logs'
+LOG_FILE_PATTERN = re.compile(r'^(\d{8})\.log$')
+LOG_DATE_PATTERN = re.compile(r'\d{8}')
+LOG_LEVELS = ['DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL']
+
+# 每条日志以 "时间 级别:" 开头，不以此开头的行属于上一条日志（例如异常堆栈）
+RECORD_HEADER = re.compile(r'^\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2},\d{3} (\w+):')
+
+LogRecord = namedtuple('LogRecord', ['offset', 'level', 'text'])
+
+
+class LogReader:
+    """
+    从文件末尾向前按块读取日志，只读取当前页需要的部分，内存占用与文件大小无关。
+    翻页位置以字节偏移表示：每个 (文件, 文件末尾位置, 筛选条件) 缓存一份各页起始偏移的索引，
+    向后翻页时从已知的最近一页继续读取，日志文件只会追加，已计算的偏移始终有效。
+    """
+
+    def __init__(self, log_dir=LOG_DIR, block_size=64 * 1024, cache_size=64):
+        self.log_dir = log_dir
+        self.block_size = block_size
+        self.cache_size = cache_size
+        self._page_index = OrderedDict()
+        self._lock = threading.Lock()
+
+    def log_dates(self):
+        """
+        返回存在日志文件的日期（YYYYMMDD），最新的在前。
+        """
+        if not os.path.isdir(self.log_dir):
+            return []
+        dates = [match.group(1) for match in map(LOG_FILE_PATTERN.match, os.listdir(self.log_dir)) if match]
+        return sorted(dates, reverse=True)
+
+    def read_page(self, date, page=1, per_page=200, level=None, text=None, end=None):
+        """
+        读取某天日志的第 page 页（第 1 页为最新的日志）。
+        :param level: 只返回该级别的日志
+        :param text: 只返回包含该文本的日志（不区分大小写）
+        :param end: 分页时固定的文件末尾位置，为 None 时使用当前文件大小，翻页链接应带上首页返回的 end
+        :return: {"records": [LogRecord]（由旧到新）, "page", "end", "has_more"}；文件不存在时返回 None
+        """
+        # 日期来自请求参数，必须是 8 位数字，避免拼出日志目录以外的路径
+        if not isinstance(date, str) or not LOG_DATE_PATTERN.fullmatch(date):
+            return None
+        path = os.path.join(self.log_dir, f'{date}.log')
+        if not os.path.isfile(path):
+            return None
+        size = os.path.getsize(path)
+        end = size if end is None or end > size else end
+        key = (path, end, level, text.lower() if text else None)
+
+        with self._lock:
+            boundaries = list(self._page_index.get(key, [end]))
+        with open(path, 'rb') as f:
+            # 从已缓存的最近一页开始，依次计算到目标页的结束偏移
+            while len(boundaries) < page and boundaries[-1] > 0:
+                _, start = self._read_before(f, boundaries[-1], per_page, level, text)
+                boundaries.append(start)
+            if len(boundaries) < page or (page > 1 and boundaries[page - 1] == 0):
+                records = []
+            else:
+                records, start = self._read_before(f, boundaries[page - 1], per_page, level, text)
+                if len(boundaries) == page:
+                    boundaries.append(start)
+        with self._lock:
+            self._page_index[key] = boundaries
+            self._page_index.move_to_end(key)
+            while len(self._page_index) > self.cache_size:
+                self._page_index.popitem(last=False)
+
+        records.reverse()
+        has_more = len(boundaries) > page and boundaries[page] > 0
+        return {"records": records, "page": page, "end": end, "has_more": has_more}
+
+    def _read_before(self, f, end, limit, level, text):
+        """
+        从 end 向前读取至多 limit 条符合条件的日志，返回 (日志列表（由新到旧）, 最早一条的起始偏移)。
+        """
+        needle = text.lower() if text else None
+        records, start = [], end
+        for record in self._iter_records_backward(f, end):
+            start = record.offset
+            if level and record.level != level:
+                continue
+            if needle and needle not in record.text.lower():
+                continue
+            records.append(record)
+            if len(records) >= limit:
+                break
+        else:
+            start = 0
+        return records, start
+
+    def _iter_records_backward(self, f, end):
+        """
+        从 end 向前逐条返回日志，续行与所属的日志合并为一条。
+        """
+        continuation = []
+        for offset, line in self._iter_lines_backward(f, end):
+            text = line.decode('utf-8', errors='replace').rstrip('\r')
+            match = RECORD_HEADER.match(text)
+            continuation.append(text)
+            if match:
+                yield LogRecord(offset, match.group(1), '\n'.join(reversed(continuation)))
+                continuation = []
+        if continuation:
+            # 文件开头没有时间前缀的行（例如 Flask 启动信息）单独作为一条
+            yield LogRecord(0, None, '\n'.join(reversed(continuation)))
+
+    def _iter_lines_backward(self, f, end):
+        """
+        从 end 向前按块读取，逐行返回 (行起始偏移, 行内容)，不含换行符。
+        """
+        position, remainder = end, b''
+        while position > 0:
+            read_size = min(self.block_size, position)
+            position -= read_size
+            f.seek(position)
+            block = f.read(read_size) + remainder
+            lines = block.split(b'\n')
+            # 块的第一行可能不完整，留到读取前一块时拼接
+            remainder = lines.pop(0)
+            line_offset = position + len(block)
+            for line in reversed(lines):
+                line_offset -= len(line) + 1
+                if line or line_offset + 1 < end:
+                    yield line_offset + 1, line
+        if remainder:
+            yield 0, remainder
@@ -1,28 +1,47 @@
 # methods.py
 from datetime import datetime
 from io import BytesIO
+from itertools import islice
 import logging
 import os
-from models import Admins, ExamQuestions, QuestionBanks, QuestionOptions, Questions, StudentGrades, Students, StudentAnswers, Exams, Teachers
-from peewee import DoesNotExist
+import time
+from models import db, Admins, ExamQuestions, QuestionBanks, QuestionOptions, Questions, StudentGrades, Students, StudentAnswers, Exams, Teachers
+from peewee import DoesNotExist, IntegrityError
 from check_questions.check_docx_questions import DocxQuestionImporter
 from check_questions.check_excel_questions import ExcelQuestionImporter
+from grading import GradingEngine, answer_key_cache, compute_total_grades, save_total_grades
+from answer_store import (SUBMITTED_SEQ, build_answer_rows, cleared_questions, delete_answers, is_submitted,
+                          load_existing_answers, load_submitted_markers, submitted_marker, upsert_answers)
+from exam_cache import exam_schedule, invalidate_exam_caches
+from log_config import setup_logging
 
 # 初始化日志记录
-# 配置日志文件
-local_date = datetime.strftime(datetime.now(),"%Y%m%d")
-logging.basicConfig(filename=os.path.join("./logs",f'{local_date}.log'), level=logging.INFO, 
-                    format='%(asctime)s %(levelname)s: %(message)s')
+# 日志经队列由后台线程写入 logs/YYYYMMDD.log，过了午夜自动写入新一天的文件；
+# 设置环境变量 LOG_JSON=1 时同时写入每行一条 JSON 的 logs/YYYYMMDD.jsonl
+setup_logging("./logs", level=logging.INFO, json_lines=os.environ.get('LOG_JSON', '0') == '1')
 logger = logging.getLogger(__name__)
 
+# 交卷时即时批改客观题（默认关闭，设置环境变量 GRADE_ON_SUBMIT=1 开启）
+GRADE_ON_SUBMIT = os.environ.get('GRADE_ON_SUBMIT', '0') == '1'
+
+# 导入题库时每批写入的题目数
+IMPORT_CHUNK_SIZE = 500
+# 导入结果中最多返回的错误原因条数
+IMPORT_ERROR_LIMIT = 100
+
 # 学生模块
 class StudentModule:
+    def __init__(self, grade_on_submit=GRADE_ON_SUBMIT, submission_buffer=None):
+        self.grade_on_submit = grade_on_submit
+        # 可选的交卷写缓冲（SubmissionBuffer），设置后整卷提交先写本地日志，由后台线程批量入库
+        self.submission_buffer = submission_buffer
+
     def register(self, student_id, name, student_class, gender, phone_number, password, confirm_password):
         if password != confirm_password:
-            logger.warning(f"Password confirmation failed for student {student_id}")
+            logger.warning(f"Password confirmation failed for student number {student_id}")
             return {"status": "error", "message": "Passwords do not match"}
         try:
-            Students.create(
+            student = Students.create(
                 student_id=student_id,
                 name=name,
                 student_class=student_class,
@@ -30,23 +49,29 @@ class StudentModule:
                 phone_number=phone_number,
                 password=password
             )
-            logger.info(f"Student {student_id} registered successfully")
+            logger.info(f"Student {student.id} registered successfully with student number {student_id}")
             return {"status": "success", "message": "Student registered"}
         except Exception as e:
-            logger.error(f"Error registering student {student_id}: {str(e)}")
+            logger.error(f"Error registering student number {student_id}: {str(e)}")
             return {"status": "error", "message": str(e)}
 
     def login(self, student_id, password):
         try:
             student = Students.get(Students.student_id == student_id, Students.password == password)
-            logger.info(f"Student {student_id} logged in successfully")
+            logger.info(f"Student {student.id} logged in successfully with student number {student_id}")
             return {"status": "success", "message": "Login successful"}
         except DoesNotExist:
-            logger.warning(f"Login failed for student {student_id}")
+            logger.warning(f"Login failed for student number {student_id}")
             return {"status": "error", "message": "Invalid credentials"}
 
-    def logout(self):
-        logger.info("Student logged out")
+    def logout(self, student_id=None):
+        """
+        :param student_id: 注销的学生（Students 主键），未登录时为 None
+        """
+        if student_id is None:
+            logger.info("Student logged out")
+        else:
+            logger.info(f"Student {student_id} logged out")
         return {"status": "success", "message": "Logout successful"}
 
     def list_exams(self):
@@ -54,13 +79,9 @@ class StudentModule:
         列出所有当前正在进行的考试
         """
         try:
-            current_time = datetime.now()
-            exams = Exams.select().where(
-                (Exams.start_time <= current_time) &
-                (Exams.end_time >= current_time)
-            )
-            exam_list = [{"id": exam.id, "name": exam.name, "start_time": exam.start_time, "end_time": exam.end_time} for exam in exams]
-            return {"status": "success", "exams": exam_list}
+            # 使用内存中的考试时间表，考试开始或结束时间点之间不访问数据库
+            exam_list, version = exam_schedule.snapshot()
+            return {"status": "success", "exams": exam_list, "version": version}
         except Exception as e:
             return {"status": "error", "message": str(e)}
 
@@ -69,41 +90,149 @@ class StudentModule:
         处理学生提交的答案
         """
         try:
-            student = Students.get(Students.id == student_id)
-            exam = Exams.get(Exams.id == exam_id)
             print(answers)
-            # 遍历答案并保存到数据库
-            for question_id, answer_data in answers.items():
-                question = Questions.get(Questions.id == question_id)
-                selected_option_id = answer_data.get('selected_option_id')
-                answer_text = answer_data.get('answer_text')
-
-                # 查找或创建学生答案记录
-                student_answer, created = StudentAnswers.get_or_create(
-                    student=student,
-                    exam=exam,
-                    question=question,
-                    defaults={"selected_option": selected_option_id, "answer_text": answer_text}
-                )
-
-                if not created:
-                    # 如果记录已存在，更新答案
-                    student_answer.selected_option = selected_option_id
-                    student_answer.answer_text = answer_text
-                    student_answer.save()
-
+            if self.submission_buffer:
+                self.submission_buffer.submit(student_id, exam_id, answers)
+                return {"status": "success", "message": "Answers accepted"}
+            self._store_answers(student_id, exam_id, answers)
             return {"status": "success", "message": "Answers submitted successfully"}
         except Exception as e:
             return {"status": "error", "message": str(e)}
 
+    def store_submissions(self, submissions):
+        """
+        把多名学生的整卷提交合并成批量 upsert 写入数据库，供写缓冲的后台线程调用。
+        :param submissions: [{"student_id": ..., "exam_id": ..., "answers": {...}, "submitted_at": ...}]
+        """
+        # 在后台线程中运行，用完立即把连接归还连接池
+        with db.connection_context():
+            rows = {}
+            # {(student_id, exam_id, question_id): 提交标记}，取消作答的题目
+            cleared = {}
+            affected_students = {}
+            # 同一学生同一题以提交时间最晚的一次为准，恢复的日志与新提交可能以任意顺序进入同一批
+            for submission in sorted(submissions, key=lambda submission: submission.get("submitted_at") or 0):
+                student_id, exam_id = submission["student_id"], submission["exam_id"]
+                marker = submitted_marker(submission.get("submitted_at"))
+                answer_key = answer_key_cache.get(exam_id) if self.grade_on_submit else None
+                for question_id in cleared_questions(submission["answers"]):
+                    rows.pop((student_id, exam_id, question_id), None)
+                    cleared[(student_id, exam_id, question_id)] = marker
+                for row in build_answer_rows(student_id, exam_id, submission["answers"], answer_key):
+                    row["reserved2"] = marker
+                    rows[(row["student"], row["exam"], row["question"])] = row
+                    cleared.pop((row["student"], row["exam"], row["question"]), None)
+                affected_students.setdefault(exam_id, set()).add(student_id)
+
+            try:
+                with db.atomic():
+                    # 按主键顺序锁定学生记录，与其他线程和进程中同一学生的提交互斥，
+                    # 比较提交时间和重新汇总总分时数据不会被修改
+                    student_ids = sorted({student_id for student_ids in affected_students.values()
+                                          for student_id in student_ids})
+                    list(Students.select(Students.id).where(Students.id.in_(student_ids))
+                         .order_by(Students.id).for_update())
+                    # 跳过已被更晚的整卷提交覆盖的答案，例如崩溃后学生经其他进程重新提交，之后才重放本条日志
+                    stored = load_submitted_markers(student_ids, list(affected_students))
+                    upsert_answers([row for key, row in rows.items() if stored.get(key, '') <= row["reserved2"]])
+                    deletes = {}
+                    for (student_id, exam_id, question_id), marker in cleared.items():
+                        if stored.get((student_id, exam_id, question_id), '') <= marker:
+                            deletes.setdefault((student_id, exam_id), []).append(question_id)
+                    for (student_id, exam_id), question_ids in deletes.items():
+                        delete_answers(student_id, exam_id, question_ids)
+                    if self.grade_on_submit:
+                        for exam_id, student_ids in affected_students.items():
+                            save_total_grades(exam_id, compute_total_grades(exam_id, student_ids))
+            except IntegrityError as e:
+                # 学生或考试在写库前已被删除时，逐条写入以免整批提交都无法入库
+                logger.warning(f"Batch answer write failed, storing submissions one by one: {str(e)}")
+                for submission in sorted(submissions, key=lambda submission: submission.get("submitted_at") or 0):
+                    try:
+                        self._store_answers(submission["student_id"], submission["exam_id"], submission["answers"],
+                                            submitted_at=submission.get("submitted_at"))
+                    except (DoesNotExist, IntegrityError) as e:
+                        logger.error(f"Dropping buffered submission of student {submission['student_id']} "
+                                     f"for exam {submission['exam_id']}: {str(e)}")
+            return len(rows)
+
+    def save_answer_delta(self, student_id, exam_id, seq, answers):
+        """
+        保存小程序自上次同步以来修改过的答案，取消作答的题目删除已保存的答案。
+        seq 为客户端递增的同步序号，序号不大于已保存序号的答案视为重复或过期提交并忽略，
+        因此同一增量重复发送是幂等的；整卷提交之后到达的增量全部忽略。
+        """
+        try:
+            applied = self._store_answers(student_id, exam_id, answers, seq=seq)
+            return {"status": "success", "seq": seq, "applied": applied}
+        except Exception as e:
+            logger.error(f"Error saving answer delta for student {student_id} in exam {exam_id}: {str(e)}")
+            return {"status": "error", "message": str(e)}
+
+    def _store_answers(self, student_id, exam_id, answers, seq=None, submitted_at=None):
+        """
+        整卷提交和增量同步共用的存储逻辑，返回实际写入和删除的答案数量。
+        :param submitted_at: 写缓冲中整卷提交的提交时间，已被更晚的整卷提交覆盖的答案不再写入；
+                             不传时按当前时间提交
+        """
+        student = Students.get(Students.id == student_id)
+        exam = Exams.get(Exams.id == exam_id)
+        # 开启即时批改时使用缓存的答案，不额外查询
+        answer_key = answer_key_cache.get(exam.id) if self.grade_on_submit else None
+        rows = build_answer_rows(student.id, exam.id, answers, answer_key)
+        cleared = cleared_questions(answers)
+        with db.atomic():
+            if self.grade_on_submit or seq is not None or submitted_at is not None:
+                # 锁定学生记录，同一学生并发的提交在此排队，总分和同步序号都按排队后的最新数据计算。
+                # 不锁答案行：首次提交时答案行尚不存在，InnoDB 会改加间隙锁，不同学生的间隙锁互不冲突，
+                # 随后各自的 INSERT 又互相等待对方的间隙锁而死锁
+                Students.select(Students.id).where(Students.id == student.id).for_update().get()
+            if seq is not None:
+                if is_submitted(student.id, exam.id):
+                    # 已整卷提交，晚到的增量同步不再写入
+                    return 0
+                existing = load_existing_answers(student.id, exam.id, [row["question"] for row in rows] + cleared)
+                # 丢弃已被相同或更新序号覆盖过的答案；取消作答只删除序号更早的答案，
+                # 删除后该题不再保留序号，以整卷提交时的答案为准
+                rows = [row for row in rows if self._stored_seq(existing, row["question"]) < seq]
+                cleared = [question_id for question_id in cleared
+                           if question_id in existing and self._stored_seq(existing, question_id) < seq]
+                for row in rows:
+                    row["reserved2"] = str(seq)
+            else:
+                marker = submitted_marker(time.time() if submitted_at is None else submitted_at)
+                if submitted_at is not None:
+                    stored = load_submitted_markers([student.id], [exam.id])
+                    rows = [row for row in rows if stored.get((student.id, exam.id, row["question"]), '') <= marker]
+                    cleared = [question_id for question_id in cleared
+                               if stored.get((student.id, exam.id, question_id), '') <= marker]
+                for row in rows:
+                    row["reserved2"] = marker
+            # 所有答案一次写入，已存在的记录直接更新
+            upsert_answers(rows)
+            # 取消作答的题目删除已保存的答案（包括之前增量同步的答案），不再参与批改
+            deleted = delete_answers(student.id, exam.id, cleared)
+            if self.grade_on_submit and (rows or deleted):
+                # 在同一事务中按已保存的得分重新汇总该学生的总分，不累加增量，避免小数得分被截断后累积误差
+                save_total_grades(exam.id, compute_total_grades(exam.id, [student.id]))
+        return len(rows) + deleted
+
+    def _stored_seq(self, existing, question_id):
+        if question_id not in existing or existing[question_id][1] is None:
+            return -1
+        if existing[question_id][1].startswith(SUBMITTED_SEQ):
+            return float('inf')
+        return int(existing[question_id][1])
+
 
 # 教师模块
 class TeacherModule:
+    grading_engine = GradingEngine()
 
     def register(self, teacher_id, name, gender, phone_number, password, confirm_password):
         # 检查密码和确认密码是否匹配
         if password != confirm_password:
-            logger.warning(f"Password confirmation failed for teacher {teacher_id}")
+            logger.warning(f"Password confirmation failed for teacher '{teacher_id}'")
             return {"status": "error", "message": "Passwords do not match"}
 
         try:
@@ -115,25 +244,28 @@ class TeacherModule:
                 phone_number=phone_number,
                 password=password
             )
-            logger.info(f"Teacher {teacher_id} registered successfully")
+            logger.info(f"Teacher '{teacher_id}' registered successfully")
             return {"status": "success", "message": "Teacher registered"}
         except Exception as e:
-            logger.error(f"Error registering teacher {teacher_id}: {str(e)}")
+            logger.error(f"Error registering teacher '{teacher_id}': {str(e)}")
             return {"status": "error", "message": str(e)}
 
     def login(self, teacher_id, password):
         try:
             # 验证教师ID和密码
             teacher = Teachers.get(Teachers.teacher_id == teacher_id, Teachers.password == password)
-            logger.info(f"Teacher {teacher_id} logged in successfully")
+            logger.info(f"Teacher '{teacher_id}' logged in successfully")
             return {"status": "success", "message": "Login successful"}
         except DoesNotExist:
-            logger.warning(f"Login failed for teacher {teacher_id}")
+            logger.warning(f"Login failed for teacher '{teacher_id}'")
             return {"status": "error", "message": "Invalid credentials"}
 
-    def logout(self):
+    def logout(self, teacher_id=None):
         # 处理教师注销
-        logger.info("Teacher logged out")
+        if teacher_id is None:
+            logger.info("Teacher logged out")
+        else:
+            logger.info(f"Teacher '{teacher_id}' logged out")
         return {"status": "success", "message": "Logout successful"}
 
     def manage_question_bank(self, action, question_bank_id=None, question_bank_name=None):
@@ -154,6 +286,7 @@ class TeacherModule:
             # 删除题库
             question_bank = QuestionBanks.get(QuestionBanks.id == question_bank_id)
             question_bank.delete_instance()
+            invalidate_exam_caches()
             return {"status": "success", "message": "Question bank deleted successfully"}
 
         else:
@@ -173,6 +306,7 @@ class TeacherModule:
             question.content = content
             question.answer = answer
             question.save()
+            invalidate_exam_caches()
             return question
         else:
             return None
@@ -188,58 +322,145 @@ class TeacherModule:
                 option_text=option_text,
                 is_correct=is_correct
             )
+        invalidate_exam_caches()
         return True
     
-    def import_question_bank(self, file_path, question_bank_id):
+    def import_question_bank(self, file_path, question_bank_id, all_or_nothing=True, progress=None):
+        """
+        解析题库文件并批量写入题目和选项。
+        :param all_or_nothing: 为 True 时先识别完整个文件，再在一个事务中写入全部题目，任一批失败则全部回滚；
+                               识别期间不占用数据库连接和事务，但识别结果需全部保存在内存中，
+                               题目在全部识别完成后才可见。
+                               为 False 时每识别出一批题目立即单独提交，题目陆续可见，内存占用与文件大小无关；
+                               失败的批次跳过并记录，其余批次照常导入，中途失败时已提交的批次保留。
+        :param progress: 可选的进度回调，参数为 (阶段, 已处理题目数, 题目总数的估算值)
+        :return: 除 status、message 外包含 imported（写入的题目数）、failed（写入失败的题目数）、
+                 skipped（识别失败或内容不完整而跳过的题目数）和 errors（失败和跳过的原因）
+        """
+        progress = progress or (lambda stage, processed, total: None)
+        # 导入可能持续数分钟，连接只在写入数据库时占用；若调用时已有连接（例如在请求中调用）则保持原状
+        release_connection = db.is_closed()
         try:
             excel_importer = ExcelQuestionImporter()
             docx_importer = DocxQuestionImporter()
-            # 根据文件类型选择解析器
-            if file_path.endswith('.xlsx'):
-                parsed_data = excel_importer.recognize_tabular_questions(file_path)
-            elif file_path.endswith('.csv'):
-                parsed_data = excel_importer.recognize_tabular_questions(file_path)
+            # 根据文件类型选择解析器，解析器边读取边识别，逐题返回结果；
+            # 题目总数在读取完成前未知，表格使用行数估算，Word 文档使用已读取的题目数
+            if file_path.endswith('.xlsx') or file_path.endswith('.csv'):
+                importer = excel_importer
+                parsed_data = excel_importer.iter_tabular_questions(file_path)
+                estimated_rows = excel_importer.estimate_rows(file_path)
+                estimate_total = lambda: estimated_rows
             elif file_path.endswith('.docx'):
-                parsed_data = docx_importer.import_question_bank(file_path)
+                importer = docx_importer
+                parsed_data = docx_importer.iter_questions(file_path)
+                estimate_total = lambda: docx_importer.questions_read
             else:
                 logger.error("Unsupported file type")
                 return {"status": "error", "message": "仅支持 Excel (.xlsx, .csv) 和 Word (.docx) 文件"}
 
             # 获取对应的题库
             question_bank = QuestionBanks.get_or_none(QuestionBanks.id == question_bank_id)
+            if release_connection:
+                db.close()
             if not question_bank:
                 logger.error(f"Question bank {question_bank_id} not found")
                 return {"status": "error", "message": "Question bank not found"}
-            
-            # 导入解析的数据到数据库
-            for question_data in parsed_data:
-                # 处理题目类型转换
-                question_type = self.map_question_type(question_data['question_type'])
-
-                # 创建新的题目
-                question = Questions.create(
-                    question_bank=question_bank,
-                    question_type=question_type,
-                    content=question_data['content'],
-                    answer=question_data.get('answer', None)
-                )
-                
-                # 处理选项，仅对单选题、多选题和判断题进行选项入库
-                if question_type in ['单选题', '多选题', '判断题']:
-                    options = question_data.get('options', [])
-                    for option in options:
-                        QuestionOptions.create(
-                            question=question,
-                            option_text=option['text'],
-                            is_correct=option['is_correct']
-                        )
-
-            logger.info(f"Questions imported successfully into question bank {question_bank_id}")
-            return {"status": "success", "message": "Question bank imported successfully"}
+
+            chunks = iter(lambda: list(islice(parsed_data, IMPORT_CHUNK_SIZE)), [])
+            imported, failed, errors = 0, 0, []
+            if all_or_nothing:
+                parsed_questions = []
+                for chunk in chunks:
+                    parsed_questions.extend(chunk)
+                    progress('parsing', len(parsed_questions), max(estimate_total(), len(parsed_questions)))
+                try:
+                    with db.atomic():
+                        for start in range(0, len(parsed_questions), IMPORT_CHUNK_SIZE):
+                            imported += self._insert_questions(
+                                question_bank.id, parsed_questions[start:start + IMPORT_CHUNK_SIZE])
+                            progress('importing', imported, len(parsed_questions))
+                finally:
+                    if release_connection:
+                        db.close()
+            else:
+                # 每凑满一批立即写入，文件其余部分仍在读取和识别
+                for chunk in chunks:
+                    try:
+                        with db.atomic():
+                            imported += self._insert_questions(question_bank.id, chunk)
+                    except Exception as e:
+                        failed += len(chunk)
+                        errors.append(f"{len(chunk)} 道题目写入失败：{str(e)}")
+                        logger.error(f"Error importing {len(chunk)} questions into question bank {question_bank_id}: {str(e)}")
+                    finally:
+                        if release_connection:
+                            db.close()
+                    progress('importing', imported + failed, max(estimate_total(), imported + failed))
+            progress('importing', imported + failed, imported + failed)
+
+            # 识别失败或内容不完整的题目不影响其余题目的写入，与写入失败的原因一起返回
+            skipped = importer.skipped
+            errors = (errors + skipped.reasons)[:IMPORT_ERROR_LIMIT]
+            logger.info(f"{imported} questions imported into question bank {question_bank_id}, {failed} failed, "
+                        f"{skipped.count} skipped")
+            if failed:
+                return {"status": "error", "message": f"Imported {imported} questions, {failed} failed",
+                        "imported": imported, "failed": failed, "skipped": skipped.count, "errors": errors}
+            return {"status": "success", "message": "Question bank imported successfully", "imported": imported,
+                    "failed": 0, "skipped": skipped.count, "errors": errors}
 
         except Exception as e:
             logger.error(f"Error importing question bank: {str(e)}")
             return {"status": "error", "message": str(e)}
+        finally:
+            if release_connection and not db.is_closed():
+                db.close()
+
+    def _insert_questions(self, question_bank_id, parsed_questions):
+        """
+        用一条多行 INSERT 写入一批题目，再用一条多行 INSERT 写入这些题目的选项。调用方负责开启事务。
+        """
+        if not parsed_questions:
+            return 0
+        # 锁定题库记录，同一题库的导入（包括其他进程中的导入任务）逐批排队写入，
+        # 下面按ID回读时题库中不会混入其他导入任务的题目
+        QuestionBanks.select(QuestionBanks.id).where(QuestionBanks.id == question_bank_id).for_update().get()
+        question_types = [self.map_question_type(question_data['question_type']) for question_data in parsed_questions]
+        first_id = Questions.insert_many(
+            [(question_bank_id, question_type, question_data['content'], question_data.get('answer', None))
+             for question_type, question_data in zip(question_types, parsed_questions)],
+            fields=[Questions.question_bank, Questions.question_type, Questions.content, Questions.answer]
+        ).execute()
+        # MySQL 对多行 INSERT 返回第一行的自增ID，但 innodb_autoinc_lock_mode=2 时同一语句的ID不保证连续，
+        # 因此按ID顺序回读本题库中从该ID起的题目，按内容依次对应到本批题目（期间手工添加的题目会被跳过）
+        question_ids = []
+        inserted = (Questions
+                    .select(Questions.id, Questions.content)
+                    .where(Questions.question_bank == question_bank_id, Questions.id >= first_id)
+                    .order_by(Questions.id)
+                    .tuples())
+        for question_id, content in inserted:
+            if len(question_ids) == len(parsed_questions):
+                break
+            if content == parsed_questions[len(question_ids)]['content']:
+                question_ids.append(question_id)
+        if len(question_ids) != len(parsed_questions):
+            raise IntegrityError(f"Expected {len(parsed_questions)} inserted questions from id {first_id}, "
+                                 f"matched {len(question_ids)}")
+
+        # 处理选项，仅对单选题、多选题和判断题进行选项入库
+        option_rows = [
+            (question_id, option['text'], option['is_correct'])
+            for question_id, question_type, question_data in zip(question_ids, question_types, parsed_questions)
+            if question_type in ['单选题', '多选题', '判断题']
+            for option in question_data.get('options', [])
+        ]
+        for start in range(0, len(option_rows), IMPORT_CHUNK_SIZE * 4):
+            QuestionOptions.insert_many(
+                option_rows[start:start + IMPORT_CHUNK_SIZE * 4],
+                fields=[QuestionOptions.question, QuestionOptions.option_text, QuestionOptions.is_correct]
+            ).execute()
+        return len(parsed_questions)
 
     def map_question_type(self, raw_type):
         """
@@ -266,6 +487,7 @@ class TeacherModule:
                 end_time=end_time,
                 question_bank=question_bank_id
             )
+            invalidate_exam_caches(exam.id)
             logger.info(f"Exam '{name}' created successfully")
             return {"status": "success", "message": "Exam created successfully", "exam_id": exam.id}
         except Exception as e:
@@ -276,6 +498,7 @@ class TeacherModule:
         try:
             exam = Exams.get_by_id(exam_id)
             exam.delete_instance(recursive=True)
+            invalidate_exam_caches(exam_id)
             logger.info(f"Exam ID '{exam_id}' deleted successfully")
             return {"status": "success", "message": "Exam deleted successfully"}
         except DoesNotExist:
@@ -293,6 +516,7 @@ class TeacherModule:
             if end_time:
                 exam.end_time = datetime.strptime(end_time, '%Y-%m-%dT%H:%M')
             exam.save()
+            invalidate_exam_caches(exam_id)
             logger.info(f"Exam ID '{exam_id}' updated successfully")
             return {"status": "success", "message": "Exam updated successfully"}
         except DoesNotExist:
@@ -312,6 +536,7 @@ class TeacherModule:
                     question=question_id,
                     score=score
                 )
+            invalidate_exam_caches(exam_id)
             logger.info(f"Questions assigned to exam ID '{exam_id}' successfully")
             return {"status": "success", "message": "Questions assigned to exam successfully"}
         except Exception as e:
@@ -320,40 +545,12 @@ class TeacherModule:
 
     def auto_grade_exam(self, exam_id):
         try:
-            exam_questions = ExamQuestions.select().where(ExamQuestions.exam == exam_id)
-            for eq in exam_questions:
-                if eq.question.question_type in ['单选题', '多选题', '判断题']:
-                    student_answers = StudentAnswers.select().where(
-                        StudentAnswers.exam == exam_id,
-                        StudentAnswers.question == eq.question
-                    )
-                    correct_options = QuestionOptions.select().where(
-                        QuestionOptions.question == eq.question,
-                        QuestionOptions.is_correct == True
-                    )
-                    correct_option_ids = [str(option.id) for option in correct_options]
-
-                    for sa in student_answers:
-                        if eq.question.question_type == '单选题':
-                            if sa.selected_option and str(sa.selected_option.id) in correct_option_ids:
-                                sa.reserved1 = str(eq.score)
-                            else:
-                                sa.reserved1 = '0'
-                        elif eq.question.question_type == '多选题':
-                            student_option_ids = sa.answer_text.split(',') if sa.answer_text else []
-                            if set(student_option_ids) == set(correct_option_ids):
-                                sa.reserved1 = str(eq.score)
-                            else:
-                                sa.reserved1 = '0'
-                        elif eq.question.question_type == '判断题':
-                            if sa.selected_option and str(sa.selected_option.id) in correct_option_ids:
-                                sa.reserved1 = str(eq.score)
-                            else:
-                                sa.reserved1 = '0'
-                        sa.save()
-
-            # 计算每个学生的总成绩并保存到 StudentGrades 表
-            self.calculate_and_save_total_grades(exam_id)
+            with db.atomic():
+                # 一次加载答案、内存中批改、按分值批量回写
+                self.grading_engine.grade_exam(exam_id)
+
+                # 计算每个学生的总成绩并保存到 StudentGrades 表
+                self.calculate_and_save_total_grades(exam_id)
 
             logger.info(f"Exam ID '{exam_id}' auto graded successfully")
             return {"status": "success", "message": "Exam auto graded successfully"}
@@ -361,29 +558,14 @@ class TeacherModule:
             logger.error(f"Error auto grading exam ID '{exam_id}': {str(e)}")
             return {"status": "error", "message": str(e)}
 
-    def calculate_and_save_total_grades(self, exam_id):
-        # 获取参加考试的所有学生
-        students = Students.select().join(StudentAnswers).where(StudentAnswers.exam == exam_id).distinct()
-        for student in students:
-            # 计算学生的总成绩
-            total_grade = 0.0
-            student_answers = StudentAnswers.select().where(
-                StudentAnswers.exam == exam_id,
-                StudentAnswers.student == student
-            )
-            for sa in student_answers:
-                if sa.reserved1:
-                    total_grade += float(sa.reserved1)
-
-            # 更新或创建 StudentGrades 表中的记录
-            student_grade, created = StudentGrades.get_or_create(
-                student=student,
-                exam=exam_id,
-                defaults={'grade': total_grade}
-            )
-            if not created:
-                student_grade.grade = total_grade
-                student_grade.save()
+    def calculate_and_save_total_grades(self, exam_id, student_ids=None):
+        """
+        汇总学生各题得分并写入 StudentGrades 表，手动阅卷后也可单独调用。
+        :param student_ids: 可选，只重新汇总指定学生（Students 主键）的成绩
+        """
+        totals = compute_total_grades(exam_id, student_ids)
+        save_total_grades(exam_id, totals)
+        return totals
 
     def view_exam_grades(self, exam_id, student_id=None, student_name=None):
         try:
@@ -439,22 +621,25 @@ class AdminModule:
         try:
             # 验证管理员用户名和密码
             admin = Admins.get(Admins.admin_id == username, Admins.password == password)
-            logger.info(f"Admin {username} logged in successfully")
+            logger.info(f"Admin '{username}' logged in successfully")
             return {"status": "success", "message": "Login successful"}
         except DoesNotExist:
-            logger.warning(f"Login failed for admin {username}")
+            logger.warning(f"Login failed for admin '{username}'")
             return {"status": "error", "message": "Invalid credentials"}
 
-    def logout(self):
+    def logout(self, admin_id=None):
         # 处理管理员注销
-        logger.info("Admin logged out")
+        if admin_id is None:
+            logger.info("Admin logged out")
+        else:
+            logger.info(f"Admin '{admin_id}' logged out")
         return {"status": "success", "message": "Logout successful"}
 
     def modify_teacher_account(self, action, teacher_id=None, teacher_info=None):
         try:
             if action == 'add':
                 Teachers.create(**teacher_info)
-                logger.info(f"Teacher {teacher_info['teacher_id']} added successfully")
+                logger.info(f"Teacher '{teacher_info['teacher_id']}' added successfully")
                 return {"status": "success", "message": "Teacher added successfully"}
 
             elif action == 'update':
@@ -464,14 +649,14 @@ class AdminModule:
                 teacher.phone_number = teacher_info['phone_number']  # 更新手机号
                 teacher.password = teacher_info['password']  # 更新密码
                 teacher.save()  # 保存修改
-                logger.info(f"Teacher {teacher_id} updated successfully")
+                logger.info(f"Teacher '{teacher_id}' updated successfully")
                 return {"status": "success", "message": "Teacher updated successfully"}
 
 
             elif action == 'delete':
                 teacher = Teachers.get(Teachers.teacher_id == teacher_id)
                 teacher.delete_instance()
-                logger.info(f"Teacher {teacher_id} deleted successfully")
+                logger.info(f"Teacher '{teacher_id}' deleted successfully")
                 return {"status": "success", "message": "Teacher deleted successfully"}
 
             elif action == 'query':
@@ -489,17 +674,17 @@ class AdminModule:
                 return {"status": "error", "message": "Invalid action"}
         
         except DoesNotExist:
-            logger.error(f"Teacher {teacher_id} does not exist")
+            logger.error(f"Teacher '{teacher_id}' does not exist")
             return {"status": "error", "message": "Teacher not found"}
         except Exception as e:
-            logger.error(f"Error modifying teacher {teacher_id}: {str(e)}")
+            logger.error(f"Error modifying teacher '{teacher_id}': {str(e)}")
             return {"status": "error", "message": str(e)}
 
     def modify_student_account(self, action, student_id=None, student_info=None):
         try:
             if action == 'add':
-                Students.create(**student_info)
-                logger.info(f"Student {student_info['student_id']} added successfully")
+                student = Students.create(**student_info)
+                logger.info(f"Student {student.id} added successfully with student number {student_info['student_id']}")
                 return {"status": "success", "message": "Student added successfully"}
 
             elif action == 'update':
@@ -509,14 +694,14 @@ class AdminModule:
                 student.phone_number = student_info['phone_number']  # 更新手机号
                 student.password = student_info['password']  # 更新密码
                 student.save()  # 保存更改
-                logger.info(f"Student {student_id} updated successfully")
+                logger.info(f"Student {student.id} updated successfully, student number {student_id}")
                 return {"status": "success", "message": "Student updated successfully"}
 
 
             elif action == 'delete':
                 student = Students.get(Students.student_id == student_id)
                 student.delete_instance()
-                logger.info(f"Student {student_id} deleted successfully")
+                logger.info(f"Student {student.id} deleted successfully, student number {student_id}")
                 return {"status": "success", "message": "Student deleted successfully"}
 
             elif action == 'query':
@@ -534,10 +719,10 @@ class AdminModule:
                 return {"status": "error", "message": "Invalid action"}
         
         except DoesNotExist:
-            logger.error(f"Student {student_id} does not exist")
+            logger.error(f"Student number {student_id} does not exist")
             return {"status": "error", "message": "Student not found"}
         except Exception as e:
-            logger.error(f"Error modifying student {student_id}: {str(e)}")
+            logger.error(f"Error modifying student number {student_id}: {str(e)}")
             return {"status": "error", "message": str(e)}
 
     def log_system_activity(self, operation):
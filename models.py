@@ -1,16 +1,22 @@
 # models.py
 from peewee import (
     Model, CharField, IntegerField, ForeignKeyField, TextField, 
-    DateTimeField, TimestampField, BooleanField, MySQLDatabase
+    DateTimeField, TimestampField, BooleanField
 )
 from datetime import datetime
+import os
+from playhouse.pool import PooledMySQLDatabase
 
-db = MySQLDatabase(
-    'bs',
-    user='root',
-    password='111111',
-    host='127.0.0.1',
-    port=3306
+# 数据库连接池，配置可通过环境变量覆盖
+db = PooledMySQLDatabase(
+    os.environ.get('DB_NAME', 'bs'),
+    user=os.environ.get('DB_USER', 'root'),
+    password=os.environ.get('DB_PASSWORD', '111111'),
+    host=os.environ.get('DB_HOST', '127.0.0.1'),
+    port=int(os.environ.get('DB_PORT', 3306)),
+    max_connections=int(os.environ.get('DB_MAX_CONNECTIONS', 20)),  # 连接池最大连接数
+    stale_timeout=int(os.environ.get('DB_STALE_TIMEOUT', 300)),  # 连接空闲超过该秒数后回收重建
+    timeout=int(os.environ.get('DB_POOL_TIMEOUT', 10))  # 连接池耗尽时等待空闲连接的秒数
 )
 
 class BaseModel(Model):
@@ -50,6 +56,12 @@ class Questions(BaseModel):
     content = TextField()
     answer = TextField(null=True)
 
+    class Meta:
+        # 见 sql/0160questions_indexes.sql
+        indexes = (
+            (('question_bank', 'question_type', 'id'), False),
+        )
+
 class QuestionOptions(BaseModel):
     question = ForeignKeyField(Questions, backref='options', on_delete='CASCADE')
     option_text = TextField()
@@ -62,6 +74,12 @@ class Exams(BaseModel):
     question_bank = ForeignKeyField(QuestionBanks, backref='exams', on_delete='CASCADE')
     created_at = TimestampField(default=datetime.now)
 
+    class Meta:
+        # 见 sql/0150exams_indexes.sql
+        indexes = (
+            (('start_time', 'end_time'), False),
+        )
+
 class ExamQuestions(BaseModel):
     exam = ForeignKeyField(Exams, backref='exam_questions', on_delete='CASCADE')
     question = ForeignKeyField(Questions, backref='exam_questions', on_delete='CASCADE')
@@ -71,6 +89,13 @@ class StudentGrades(BaseModel):
     student = ForeignKeyField(Students, backref='grades', on_delete='CASCADE')
     exam = ForeignKeyField(Exams, backref='grades', on_delete='CASCADE')
     grade = IntegerField(null=True)
+
+    class Meta:
+        # 见 sql/0110studentgrades_unique_student_exam.sql、sql/0140studentgrades_indexes.sql
+        indexes = (
+            (('student', 'exam'), True),
+            (('exam', 'student'), False),
+        )
     
 class StudentAnswers(BaseModel):
     student = ForeignKeyField(Students, backref='answers', on_delete='CASCADE')
@@ -79,3 +104,10 @@ class StudentAnswers(BaseModel):
     selected_option = ForeignKeyField(QuestionOptions, null=True, backref='answers', on_delete='CASCADE')
     answer_text = TextField(null=True)
 
+    class Meta:
+        # 见 sql/0120studentanswers_unique_student_exam_question.sql、sql/0130studentanswers_indexes.sql
+        indexes = (
+            (('student', 'exam', 'question'), True),
+            (('exam', 'student'), False),
+            (('exam', 'question'), False),
+        )
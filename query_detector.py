@@ -0,0 +1,126 @@
+# query_detector.py
+from contextlib import contextmanager
+from functools import lru_cache
+import logging
+import os
+import re
+import sys
+import sysconfig
+import threading
+from request_metrics import get_query_hook
+
+logger = logging.getLogger(__name__)
+
+# 项目目录，报告调用位置时只取项目中的代码行，跳过 peewee、Flask 等第三方库
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+# 这些模块只负责统计SQL，不作为调用位置
+SKIPPED_FILES = {os.path.join(PROJECT_DIR, name) for name in ('query_detector.py', 'request_metrics.py')}
+LIBRARY_DIRS = tuple({os.path.abspath(sysconfig.get_paths()[name]) + os.sep for name in ('stdlib', 'purelib', 'platlib')})
+
+STRING_LITERAL = re.compile(r"'(?:[^'\\]|\\.|'')*'")
+NUMBER_LITERAL = re.compile(r'\b\d+(?:\.\d+)?\b')
+# IN (%s, %s, ...) 的参数个数随数据变化，统一为一个占位符
+PLACEHOLDER_LIST = re.compile(r'\(\s*(?:%s|\?)(?:\s*,\s*(?:%s|\?))*\s*\)')
+WHITESPACE = re.compile(r'\s+')
+
+
+class NPlusOneError(RuntimeError):
+    """
+    raise 模式下，同一形状的SQL在一次请求中执行次数超过阈值时抛出。
+    """
+
+
+@lru_cache(maxsize=1024)
+def fingerprint(sql):
+    """
+    把SQL归一为“形状”：字面量替换为 ?，IN 列表合并为一个占位符，参数不同的同一条查询得到相同的结果。
+    """
+    shape = STRING_LITERAL.sub('?', sql)
+    shape = NUMBER_LITERAL.sub('?', shape)
+    shape = shape.replace('%s', '?')
+    shape = PLACEHOLDER_LIST.sub('(?)', shape)
+    return WHITESPACE.sub(' ', shape).strip()
+
+
+def call_site():
+    """
+    :return: 触发当前SQL的项目代码位置，形如 "api.py:250 in take_exam"；
+             调用方不在项目目录中（例如测试代码）时返回第一个非第三方库的代码位置
+    """
+    frame, fallback = sys._getframe(1), None
+    while frame is not None:
+        filename = os.path.abspath(frame.f_code.co_filename)
+        if filename not in SKIPPED_FILES:
+            if filename.startswith(PROJECT_DIR + os.sep):
+                return f"{os.path.relpath(filename, PROJECT_DIR)}:{frame.f_lineno} in {frame.f_code.co_name}"
+            if fallback is None and not filename.startswith(LIBRARY_DIRS) and not filename.startswith('<'):
+                fallback = f"{filename}:{frame.f_lineno} in {frame.f_code.co_name}"
+        frame = frame.f_back
+    return fallback or 'unknown'
+
+
+class NPlusOneDetector:
+    """
+    开发和测试用的 N+1 查询检测：记录一次请求（或 track 范围）内每种SQL形状的执行次数，
+    超过阈值时按 mode 记录警告（warn）或抛出 NPlusOneError（raise），并给出触发查询的代码位置。
+    同一请求中每种SQL形状只报告一次。
+    """
+
+    def __init__(self, app=None, database=None, threshold=5, mode='warn'):
+        """
+        :param threshold: 同一形状的SQL允许执行的次数，超过即报告
+        :param mode: warn 或 raise
+        """
+        self.threshold = threshold
+        self.mode = mode
+        self._local = threading.local()
+        if database is not None:
+            get_query_hook(database).add_listener(self._on_query)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        from flask import request
+
+        @app.before_request
+        def start_query_detection():
+            self._start(request.endpoint or request.path)
+
+        @app.teardown_request
+        def stop_query_detection(exc):
+            self._local.counts = None
+
+    @contextmanager
+    def track(self, label):
+        """
+        在请求之外检测一段代码，例如测试中直接调用 methods.py 中的方法：
+            with detector.track('grade_exam'):
+                teacher_module.grade_exam(exam_id)
+        """
+        previous = (getattr(self._local, 'counts', None), getattr(self._local, 'label', None),
+                    getattr(self._local, 'reported', None))
+        self._start(label)
+        try:
+            yield
+        finally:
+            self._local.counts, self._local.label, self._local.reported = previous
+
+    def _start(self, label):
+        self._local.counts = {}
+        self._local.label = label
+        self._local.reported = set()
+
+    def _on_query(self, sql, params, elapsed):
+        counts = getattr(self._local, 'counts', None)
+        if counts is None:
+            return
+        shape = fingerprint(sql)
+        count = counts[shape] = counts.get(shape, 0) + 1
+        if count <= self.threshold or shape in self._local.reported:
+            return
+        self._local.reported.add(shape)
+        message = (f"Possible N+1 query in {self._local.label}: executed more than {self.threshold} times, "
+                   f"called from {call_site()}: {shape}")
+        if self.mode == 'raise':
+            raise NPlusOneError(message)
+        logger.warning(message)
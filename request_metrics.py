@@ -0,0 +1,170 @@
+# request_metrics.py
+from bisect import bisect_left
+import threading
+import time
+
+# 请求耗时（秒）、每个请求的SQL条数和SQL耗时（秒）的直方图分桶
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SQL_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+SQL_TIME_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class QueryHook:
+    """
+    peewee 没有执行SQL的回调，这里替换数据库实例的 execute_sql，每条SQL执行后依次调用监听函数。
+    监听函数签名为 listener(sql, params, elapsed)，在执行SQL的线程中同步调用，应尽量轻量。
+    """
+
+    def __init__(self, database):
+        self.database = database
+        self._listeners = []
+        execute_sql = database.execute_sql
+
+        def timed_execute_sql(sql, params=None, commit=None):
+            if not self._listeners:
+                return execute_sql(sql, params, commit)
+            started = time.perf_counter()
+            try:
+                return execute_sql(sql, params, commit)
+            finally:
+                elapsed = time.perf_counter() - started
+                for listener in self._listeners:
+                    listener(sql, params, elapsed)
+
+        database.execute_sql = timed_execute_sql
+
+    def add_listener(self, listener):
+        self._listeners.append(listener)
+
+    def remove_listener(self, listener):
+        if listener in self._listeners:
+            self._listeners.remove(listener)
+
+
+_query_hooks = {}
+_query_hooks_lock = threading.Lock()
+
+
+def get_query_hook(database):
+    """
+    返回数据库实例的 QueryHook，同一实例只替换一次 execute_sql。
+    """
+    with _query_hooks_lock:
+        if id(database) not in _query_hooks:
+            _query_hooks[id(database)] = QueryHook(database)
+        return _query_hooks[id(database)]
+
+
+class Histogram:
+    """
+    按标签分组的累计直方图，输出格式与 Prometheus histogram 一致。
+    """
+
+    def __init__(self, name, help_text, label_names, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = tuple(buckets)
+        # {标签值元组: [各桶计数..., +Inf 桶计数, 总和]}
+        self._series = {}
+
+    def observe(self, labels, value):
+        """
+        调用方负责加锁。
+        """
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        for labels, series in sorted(self._series.items()):
+            label_text = ','.join(f'{name}="{_escape(value)}"' for name, value in zip(self.label_names, labels))
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), series[:-1]):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{label_text},le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_sum{{{label_text}}} {series[-1]:.6f}')
+            lines.append(f'{self.name}_count{{{label_text}}} {cumulative}')
+        return lines
+
+
+class RequestMetrics:
+    """
+    记录每个路由的请求耗时、状态码，以及每个请求执行的SQL条数和SQL总耗时。
+    SQL通过 QueryHook 统计，只计入请求线程中执行的语句，后台导入等线程的SQL不计入。
+    每个请求只在结束时加一次锁更新直方图，开销很小，可在生产环境常开。
+    """
+
+    def __init__(self, app=None, database=None):
+        self.requests = {}
+        self.latency = Histogram('http_request_duration_seconds', 'Request latency by endpoint.',
+                                 ('endpoint', 'method'), LATENCY_BUCKETS)
+        self.sql_count = Histogram('http_request_sql_queries', 'SQL queries executed per request.',
+                                   ('endpoint',), SQL_COUNT_BUCKETS)
+        self.sql_time = Histogram('http_request_sql_duration_seconds', 'Time spent in SQL per request.',
+                                  ('endpoint',), SQL_TIME_BUCKETS)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app, database)
+
+    def init_app(self, app, database):
+        """
+        注册请求钩子，应在其他 before_request 钩子之前调用，使耗时包含这些钩子的执行时间。
+        """
+        from flask import request
+        get_query_hook(database).add_listener(self._on_query)
+
+        @app.before_request
+        def start_request_metrics():
+            self._local.started = time.perf_counter()
+            self._local.sql_count = 0
+            self._local.sql_time = 0.0
+
+        @app.after_request
+        def record_request_metrics(response):
+            started = getattr(self._local, 'started', None)
+            if started is None:
+                return response
+            self._local.started = None
+            # 未匹配到路由的请求统一记为 unmatched，避免任意URL产生大量标签
+            self.observe(request.endpoint or 'unmatched', request.method, response.status_code,
+                         time.perf_counter() - started, self._local.sql_count, self._local.sql_time)
+            return response
+
+    def observe(self, endpoint, method, status, elapsed, sql_count, sql_time):
+        with self._lock:
+            key = (endpoint, method, str(status))
+            self.requests[key] = self.requests.get(key, 0) + 1
+            self.latency.observe((endpoint, method), elapsed)
+            self.sql_count.observe((endpoint,), sql_count)
+            self.sql_time.observe((endpoint,), sql_time)
+
+    def render(self):
+        """
+        :return: Prometheus 文本格式的指标
+        """
+        with self._lock:
+            lines = ['# HELP http_requests_total Requests by endpoint, method and status.',
+                     '# TYPE http_requests_total counter']
+            for (endpoint, method, status), count in sorted(self.requests.items()):
+                lines.append(f'http_requests_total{{endpoint="{_escape(endpoint)}",method="{method}",'
+                             f'status="{status}"}} {count}')
+            for histogram in (self.latency, self.sql_count, self.sql_time):
+                lines.extend(histogram.render())
+        return '\n'.join(lines) + '\n'
+
+    def _on_query(self, sql, params, elapsed):
+        if getattr(self._local, 'started', None) is None:
+            return
+        self._local.sql_count += 1
+        self._local.sql_time += elapsed
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
@@ -0,0 +1,10 @@
+-- 删除重复的成绩记录，每个学生每场考试只保留最早的一条
+DELETE g1 FROM studentgrades g1
+JOIN studentgrades g2
+    ON g1.student_id = g2.student_id
+    AND g1.exam_id = g2.exam_id
+    AND g1.id > g2.id;
+
+-- 为成绩批量 upsert 提供唯一键
+ALTER TABLE studentgrades
+    ADD UNIQUE KEY uq_studentgrades_student_exam (student_id, exam_id);
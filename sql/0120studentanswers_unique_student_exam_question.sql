@@ -0,0 +1,11 @@
+-- 删除并发重复提交产生的重复答案，每个学生每场考试每道题只保留最早的一条
+DELETE a1 FROM studentanswers a1
+JOIN studentanswers a2
+    ON a1.student_id = a2.student_id
+    AND a1.exam_id = a2.exam_id
+    AND a1.question_id = a2.question_id
+    AND a1.id > a2.id;
+
+-- 为答案批量 upsert 提供唯一键
+ALTER TABLE studentanswers
+    ADD UNIQUE KEY uq_studentanswers_student_exam_question (student_id, exam_id, question_id);
@@ -0,0 +1,5 @@
+-- 按考试汇总学生成绩、阅卷时按考试列出学生
+CREATE INDEX idx_studentanswers_exam_student ON studentanswers (exam_id, student_id);
+
+-- 自动批改、考试报表按考试和题目统计答案
+CREATE INDEX idx_studentanswers_exam_question ON studentanswers (exam_id, question_id);
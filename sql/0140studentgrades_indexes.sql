@@ -0,0 +1,2 @@
+-- 按考试查询成绩（唯一键以 student_id 开头，无法用于按考试查询）
+CREATE INDEX idx_studentgrades_exam_student ON studentgrades (exam_id, student_id);
@@ -0,0 +1,2 @@
+-- 按时间范围查询正在进行的考试
+CREATE INDEX idx_exams_start_end ON exams (start_time, end_time);
@@ -0,0 +1,2 @@
+-- 题库明细页按题型筛选并按题目ID分页
+CREATE INDEX idx_questions_bank_type_id ON questions (question_bank_id, question_type, id);
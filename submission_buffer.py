@@ -0,0 +1,326 @@
+# submission_buffer.py
+from datetime import datetime
+import glob
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from peewee import InterfaceError, OperationalError
+from file_lock import try_lock
+
+logger = logging.getLogger(__name__)
+
+# 每个进程的子目录中的锁文件，进程存活期间持有排他锁
+LOCK_FILE = '.lock'
+# 反复写库失败的提交移入此文件，需人工处理
+DEAD_LETTER_FILE = 'dead-letter.log'
+
+
+class SubmissionBuffer:
+    """
+    交卷写缓冲：请求线程把已校验的提交追加到本地日志文件后立即返回，
+    后台线程定期把多个学生的提交合并成批量 upsert 写入数据库。
+
+    每个进程使用日志目录下自己的子目录（process-<进程号>），并对其加排他文件锁，
+    多个 WSGI 进程可以共用同一日志目录（Windows 上无法加锁，同一日志目录只能由一个进程使用）。
+    子目录中的日志按段存放（journal-<序号>.log），
+    每次刷新前封存当前段并开始新段，写库成功后删除已封存的段。
+    启动时只接管锁已释放（所属进程已退出）的子目录，把其中的段移入本进程的子目录后重放；
+    upsert 是幂等的，因此重复重放同一提交不会产生重复数据；每条提交带有提交时间，
+    写库回调据此跳过已被同一学生更晚的提交覆盖的答案，重放的旧提交不会覆盖崩溃后经其他进程的提交。
+
+    追加提交采用组提交：同一时刻等待落盘的多个提交共享一次 fsync。
+    写库时的数据库连接错误整批重试；其他错误逐条重试，同一提交失败 max_attempts 次后
+    移入 dead-letter.log，不再阻塞后续提交。
+    """
+
+    def __init__(self, flush_fn, journal_dir='./journal', flush_interval=0.5, max_batch=2000, fsync=True,
+                 max_attempts=3):
+        """
+        :param flush_fn: 写库回调，接收提交字典列表 [{"id", "student_id", "exam_id", "answers", "submitted_at"}]，
+                         id 为提交的唯一标识，submitted_at 为提交时间（Unix 时间戳）
+        :param flush_interval: 后台刷新间隔（秒）
+        :param max_batch: 每次刷新最多合并的提交数
+        :param fsync: 提交返回前是否确保已落盘
+        :param max_attempts: 单条提交写库失败多少次后移入 dead-letter.log
+        """
+        self.flush_fn = flush_fn
+        self.journal_dir = journal_dir
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.fsync = fsync
+        self.max_attempts = max_attempts
+        self.process_dir = os.path.join(journal_dir, f'process-{os.getpid()}')
+        self._pending = []
+        # {提交 id: 写库失败次数}
+        self._attempts = {}
+        self._sealed_segments = []
+        self._segment = 0
+        self._journal = None
+        self._process_lock = None
+        self._lock = threading.Lock()
+        # 组提交：_written 为已写入日志的提交数，_synced 为其中已落盘的数量
+        self._written = 0
+        self._synced = 0
+        self._syncing = False
+        self._sync_cond = threading.Condition()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """
+        锁定本进程的日志子目录，重放上次未写入数据库的日志并启动后台刷新线程。
+        """
+        os.makedirs(self.process_dir, exist_ok=True)
+        self._process_lock = try_lock(os.path.join(self.process_dir, LOCK_FILE))
+        if self._process_lock is None:
+            raise RuntimeError(f"Journal directory {self.process_dir} is in use by another process")
+        self._segment = max(map(self._segment_number, self._segments(self.process_dir)), default=0)
+        self.recover()
+        self._open_segment()
+        self._thread = threading.Thread(target=self._run, name='submission-buffer', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        停止后台线程，并把缓冲中的提交全部写入数据库。
+        """
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread:
+            self._thread.join()
+        self.flush()
+        if self._journal:
+            self._journal.close()
+            self._journal = None
+        if self._process_lock and not self._pending:
+            # 全部提交都已写库，剩下的只有空的当前段，删除本进程的子目录
+            for path in self._segments(self.process_dir):
+                os.remove(path)
+            self._remove_directory(self.process_dir)
+        if self._process_lock:
+            self._process_lock.close()
+            self._process_lock = None
+
+    def submit(self, student_id, exam_id, answers):
+        """
+        追加一条提交到日志并放入缓冲，返回时提交已持久化到本地磁盘。
+        """
+        entry = {"id": uuid.uuid4().hex, "student_id": int(student_id), "exam_id": int(exam_id),
+                 "answers": {str(question_id): answer for question_id, answer in answers.items()},
+                 "submitted_at": time.time()}
+        line = json.dumps(entry, ensure_ascii=False) + "\n"
+        with self._lock:
+            self._journal.write(line)
+            self._journal.flush()
+            self._written += 1
+            ticket = self._written
+            self._pending.append(entry)
+            pending = len(self._pending)
+        if self.fsync:
+            # fsync 不在全局锁内执行，其他请求线程可以继续写入日志
+            self._wait_synced(ticket)
+        if pending >= self.max_batch:
+            self._wakeup.set()
+
+    def recover(self):
+        """
+        重放本进程子目录中遗留的段，并接管已退出进程的子目录（以及旧版本直接写在日志目录下的段），
+        把其中的提交放回缓冲等待写库。
+        """
+        recovered = 0
+        for path in self._segments(self.process_dir):
+            recovered += self._replay(path)
+
+        orphans = sorted(path for path in glob.glob(os.path.join(self.journal_dir, 'process-*'))
+                         if os.path.isdir(path) and os.path.abspath(path) != os.path.abspath(self.process_dir))
+        # 只有存在旧版本的段时才锁定日志目录本身，避免多个进程同时接管，接管后删除锁文件
+        legacy = [self.journal_dir] if self._segments(self.journal_dir) else []
+        for directory in legacy + orphans:
+            lock = try_lock(os.path.join(directory, LOCK_FILE))
+            if lock is None:
+                # 所属进程仍在运行
+                continue
+            try:
+                for path in self._segments(directory):
+                    # 移入本进程的子目录，之后与本进程的段一起在写库成功后删除
+                    self._segment += 1
+                    target = os.path.join(self.process_dir, f'journal-{self._segment}.log')
+                    os.replace(path, target)
+                    recovered += self._replay(target)
+            finally:
+                lock.close()
+            if directory == self.journal_dir:
+                try:
+                    os.remove(os.path.join(directory, LOCK_FILE))
+                except FileNotFoundError:
+                    # 另一个进程随后也检查过旧版本的段并已删除锁文件
+                    pass
+            else:
+                self._remove_directory(directory)
+        if recovered:
+            logger.info(f"Recovered {recovered} buffered submissions from journal")
+        return recovered
+
+    def flush(self):
+        """
+        把缓冲中的提交写入数据库，返回写入的提交数。
+        数据库不可用时整批保留在缓冲和日志中，下次重试；其他错误时逐条重试以隔离出错的提交。
+        """
+        with self._lock:
+            if not self._pending:
+                return 0
+            batch = self._pending[:self.max_batch]
+            del self._pending[:self.max_batch]
+            drained = not self._pending
+            if drained and self._journal:
+                # 封存当前段，之后的提交写入新段
+                self._seal_segment()
+
+        try:
+            self.flush_fn(batch)
+            failed = []
+        except (OperationalError, InterfaceError) as e:
+            logger.error(f"Database unavailable, keeping {len(batch)} buffered submissions for retry: {str(e)}")
+            failed = batch
+        except Exception as e:
+            logger.error(f"Error flushing {len(batch)} buffered submissions, retrying one by one: {str(e)}")
+            failed = self._flush_one_by_one(batch)
+
+        if failed:
+            with self._lock:
+                self._pending[:0] = failed
+            return len(batch) - len(failed)
+        if self._attempts:
+            # 之前逐条重试失败过的提交这次写库成功，不再计数
+            for entry in batch:
+                self._attempts.pop(entry["id"], None)
+
+        if drained:
+            # 已封存段中的提交都已写库，可以删除
+            with self._lock:
+                sealed, self._sealed_segments = self._sealed_segments, []
+            for path in sealed:
+                if os.path.exists(path):
+                    os.remove(path)
+        return len(batch)
+
+    def _flush_one_by_one(self, batch):
+        """
+        逐条写库，返回需要稍后重试的提交。失败次数达到 max_attempts 的提交移入 dead-letter.log。
+        """
+        failed = []
+        for index, entry in enumerate(batch):
+            try:
+                self.flush_fn([entry])
+                self._attempts.pop(entry["id"], None)
+            except (OperationalError, InterfaceError):
+                # 数据库不可用，剩余的提交全部稍后重试
+                failed.extend(batch[index:])
+                break
+            except Exception as e:
+                attempts = self._attempts.get(entry["id"], 0) + 1
+                if attempts >= self.max_attempts:
+                    self._attempts.pop(entry["id"], None)
+                    self._dead_letter(entry, e)
+                else:
+                    self._attempts[entry["id"]] = attempts
+                    failed.append(entry)
+        return failed
+
+    def _dead_letter(self, entry, error):
+        record = dict(entry, error=str(error), failed_at=datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+        with open(os.path.join(self.journal_dir, DEAD_LETTER_FILE), 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+        logger.error(f"Moved submission of student {entry['student_id']} for exam {entry['exam_id']} "
+                     f"to {DEAD_LETTER_FILE} after {self.max_attempts} failed attempts: {str(error)}")
+
+    def _wait_synced(self, ticket):
+        """
+        等待第 ticket 条提交落盘。没有正在进行的 fsync 时由当前线程执行一次，覆盖此前写入的全部提交。
+        """
+        with self._sync_cond:
+            while self._synced < ticket:
+                if not self._syncing:
+                    self._syncing = True
+                    break
+                self._sync_cond.wait()
+            else:
+                return
+        target = self._synced
+        try:
+            with self._lock:
+                target = self._written
+                # 复制文件描述符，封存段时关闭日志文件不影响正在进行的 fsync
+                fd = os.dup(self._journal.fileno())
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+        finally:
+            with self._sync_cond:
+                self._synced = max(self._synced, target)
+                self._syncing = False
+                self._sync_cond.notify_all()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            while self.flush() >= self.max_batch:
+                pass
+
+    def _seal_segment(self):
+        """
+        调用方需持有 _lock。封存前确保当前段已落盘，之后的 fsync 只针对新段。
+        """
+        self._journal.flush()
+        if self.fsync:
+            os.fsync(self._journal.fileno())
+        self._journal.close()
+        self._sealed_segments.append(self._journal.name)
+        with self._sync_cond:
+            self._synced = max(self._synced, self._written)
+            self._sync_cond.notify_all()
+        self._open_segment()
+
+    def _replay(self, path):
+        replayed = 0
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # 崩溃时最后一行可能只写了一半
+                    logger.warning(f"Skipping truncated journal entry in {path}")
+                    continue
+                # 旧版本写入的提交没有 id
+                entry.setdefault("id", uuid.uuid4().hex)
+                self._pending.append(entry)
+                replayed += 1
+        self._sealed_segments.append(path)
+        return replayed
+
+    def _remove_directory(self, directory):
+        try:
+            os.remove(os.path.join(directory, LOCK_FILE))
+            os.rmdir(directory)
+        except OSError as e:
+            logger.warning(f"Could not remove recovered journal directory {directory}: {str(e)}")
+
+    def _segments(self, directory):
+        return sorted(glob.glob(os.path.join(directory, 'journal-*.log')), key=self._segment_number)
+
+    def _open_segment(self):
+        self._segment += 1
+        path = os.path.join(self.process_dir, f'journal-{self._segment}.log')
+        self._journal = open(path, 'a', encoding='utf-8')
+
+    def _segment_number(self, path):
+        return int(os.path.basename(path)[len('journal-'):-len('.log')])